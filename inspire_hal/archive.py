@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Archives of the TEI of the records, written by dry runs of the push.
+
+An archive is a directory of shards holding the TEI of a fixed number of
+records each. Every TEI is compressed as a separate gzip member, so that a
+shard can be read whole with ``zcat`` and a single TEI can be read alone
+from its offset. The ``index.tsv`` of the archive gives, for every record,
+its control number, its shard, and the offset and length of its TEI in the
+shard.
+
+The gzip headers do not hold any date, so that the archives of two runs
+can be compared byte by byte.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import zlib
+from collections import namedtuple
+
+INDEX_FILE = 'index.tsv'
+"""Name of the index in the archive."""
+
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+IndexEntry = namedtuple('IndexEntry', ['control_number', 'shard', 'offset', 'length'])
+"""Where the TEI of a record is in an archive."""
+
+
+class TEIArchive(object):
+    """Writes the TEI of records in an archive.
+
+    Args:
+        directory(str): the directory of the archive, created if needed.
+        records_per_shard(int): number of records in every shard.
+        level(int): the compression level, from 1 to 9.
+    """
+
+    def __init__(self, directory, records_per_shard=10000, level=6):
+        self.directory = directory
+        self.records_per_shard = records_per_shard
+        self.level = level
+        self.records = 0
+        self.shards = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._index = io.open(os.path.join(directory, INDEX_FILE), 'w', encoding='utf8')
+        self._shard = None
+        self._offset = 0
+
+    def add(self, control_number, tei):
+        """Add the TEI of a record to the archive.
+
+        Args:
+            control_number(int): the control number of the record.
+            tei(bytes): its TEI.
+        """
+        if self.records % self.records_per_shard == 0:
+            self._next_shard()
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _GZIP_WBITS)
+        member = compressor.compress(tei) + compressor.flush()
+        self._shard.write(member)
+
+        self._index.write(u'%s\t%s\t%d\t%d\n' % (
+            control_number, get_shard_name(self.shards - 1), self._offset, len(member),
+        ))
+        self._offset += len(member)
+        self.records += 1
+        self.raw_bytes += len(tei)
+        self.compressed_bytes += len(member)
+
+    def close(self):
+        if self._shard:
+            self._shard.close()
+        self._index.close()
+
+    def _next_shard(self):
+        if self._shard:
+            self._shard.close()
+
+        self._shard = open(os.path.join(self.directory, get_shard_name(self.shards)), 'wb')
+        self._offset = 0
+        self.shards += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        return 'TEI archive: %d records in %d shards, %.1f MiB compressed to %.1f MiB' % (
+            self.records, self.shards, self.raw_bytes / 2 ** 20, self.compressed_bytes / 2 ** 20,
+        )
+
+
+def get_shard_name(number):
+    """Return the file name of a shard of an archive.
+
+    Examples:
+        >>> get_shard_name(3)
+        'tei-00003.xml.gz'
+
+    """
+    return 'tei-%05d.xml.gz' % number
+
+
+def read_index(directory):
+    """Read the index of an archive.
+
+    Args:
+        directory(str): the directory of the archive.
+
+    Yields:
+        IndexEntry: where the TEI of each record is, in the order they
+        were written.
+    """
+    with io.open(os.path.join(directory, INDEX_FILE), encoding='utf8') as fd:
+        for line in fd:
+            control_number, shard, offset, length = line.rstrip(u'\n').split(u'\t')
+            yield IndexEntry(int(control_number), shard, int(offset), int(length))
+
+
+def read_tei(directory, entry):
+    """Read the TEI of a record from an archive.
+
+    Args:
+        directory(str): the directory of the archive.
+        entry(IndexEntry): where the TEI is, as given by :func:`read_index`.
+
+    Returns:
+        bytes: the TEI.
+    """
+    with open(os.path.join(directory, entry.shard), 'rb') as fd:
+        fd.seek(entry.offset)
+        return zlib.decompress(fd.read(entry.length), _GZIP_WBITS)
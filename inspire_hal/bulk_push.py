@@ -35,78 +35,727 @@ $ /usr/bin/time -v inspirehep hal push
 from __future__ import absolute_import, division, print_function
 
 import datetime
+import io
+import multiprocessing
 import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from itertools import chain
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from flask import current_app
 from lxml import etree
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import array
 
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
 from invenio_records.models import RecordMetadata
-from inspire_hal.core.tei import convert_to_tei
-from inspire_hal.core.sword import create, update
+from inspire_hal.cache import LRUCache
+from inspire_hal.core import language
+from inspire_hal.core.tei import TEI_FIELDS, write_tei
+from inspire_hal.core.sword import create, get_pool, open_package, update
+from inspire_hal.fulltext import get_fulltext_url, open_fulltext
+from inspire_hal.ledger import get_fingerprint
+from inspire_hal.limiter import AdaptiveLimiter, TokenBucket
+from inspire_hal.metrics import Registry
+from inspire_hal.pipeline import map_in_order, prefetch
+from inspire_hal.retry import RetryPolicy, classify
+from inspire_hal.state import clear_checkpoint, load_checkpoint, save_checkpoint
+from inspire_hal.utils import _get_hal_id, get_linked_records, get_name_cache
 
 
-def run(limit, yield_amt):
+PUSHED_COLLECTIONS = ['Literature', 'HAL Hidden']
+"""Collections whose records are pushed to HAL."""
+
+PUSH_FIELDS = ('_collections', 'control_number', 'documents', 'external_system_identifiers')
+"""Fields of a record read when pushing it, besides those converted to TEI."""
+
+PushSummary = namedtuple(
+    'PushSummary',
+    [
+        'total', 'now', 'ok', 'ko', 'skipped', 'watermark', 'caches', 'timings', 'connections',
+        'retries', 'limiter', 'metrics',
+    ],
+)
+"""Outcome of a push.
+
+``skipped`` counts the records whose TEI did not change since their last
+upload. ``watermark`` is the ``updated`` date up to which every record is
+known to be on HAL, to be used as ``since`` by the next incremental push.
+``caches`` are the caches used by the push, reporting their hits and misses.
+``timings`` are the seconds spent in some steps of the push, by step.
+``connections`` is the pool of connections to HAL, reporting their reuse.
+``retries`` is the retry policy of the uploads, reporting the retries made.
+``limiter`` limits the load on HAL, reporting the concurrency reached.
+``metrics`` are the metrics of the push, see :data:`STAGES`.
+"""
+
+
+STAGES = OrderedDict([
+    ('db_fetch', 'reading pages of records from the DB'),
+    ('reference_resolution', 'fetching the records linked from pages of records'),
+    ('language_detection', 'detecting the languages of records'),
+    ('rendering', 'converting records to TEI, besides detecting their languages'),
+    ('upload', 'sending records to HAL, by attempt'),
+    ('retry_delay', 'waiting before retrying uploads'),
+])
+"""Stages of a push whose durations are measured, with what they do.
+
+The seconds spent in each stage are in the ``<stage>_seconds`` histogram of
+the metrics of the push.
+"""
+
+
+Candidate = namedtuple('Candidate', ['id', 'updated', 'json', 'hal_id_map', 'conference_records'])
+"""A record that might have to be pushed, as read from the DB.
+
+``hal_id_map`` and ``conference_records`` hold what the conversion needs from
+the Institution and Conference records linked from the record.
+"""
+
+Conversion = namedtuple('Conversion', ['tei', 'error', 'seconds', 'language_seconds'])
+"""Outcome of the conversion of a record to TEI, and the time it took.
+
+``tei`` is encoded in UTF-8, ready to be uploaded.
+"""
+
+
+def run(limit, yield_amt, workers=1, since=None, ledger=None, force=False,
+        checkpoint_file=None, resume=False, converters=0, shard=None, archive=None,
+        outcome_log=None, control_numbers=None):
+    """Push the records to HAL.
+
+    With an ``archive``, nothing is sent to HAL: the TEI of the records is
+    written to it instead, which measures the reading and the conversion
+    of the records alone.
+
+    The outcome of every record is written to the ``outcome_log``, if any.
+    With ``control_numbers``, only the records with those control numbers
+    are pushed, such as those that failed in a previous push.
+    """
     start = time.time()
+    app = current_app._get_current_object()
 
-    records = RecordMetadata.query.filter(RecordMetadata.json['_export_to'].op('@>')('{"HAL": true}'))
+    push = None
+    if resume and checkpoint_file:
+        push = _Push.from_checkpoint(app, workers, checkpoint_file, ledger=ledger, force=force,
+                                     outcome_log=outcome_log)
+        if push:
+            since = push.since
+            print('Resuming the push after %s records' % push.total)
+        else:
+            print('No checkpoint found, starting a new push')
 
-    if limit > 0:
-        records = records.limit(limit)
+    if not push:
+        push = _Push(app, workers, since=since, ledger=ledger, force=force,
+                     checkpoint_file=checkpoint_file, archive=archive, outcome_log=outcome_log)
 
-    total = ok = ko = 0
-    now = str(datetime.timedelta(seconds=time.time() - start))
+    # The conversion processes are forked before any other thread starts.
+    pool = _new_converter_pool(app, converters) if converters else None
 
-    for total, raw_record in enumerate(records.yield_per(yield_amt)):
-        if total % 10 == 0:
-            now = str(datetime.timedelta(seconds=time.time() - start))
+    projection = app.config['HAL_PUSH_PROJECTION']
+    caches = _new_caches(app)
+    metrics = push.metrics
 
-        record = raw_record.json
-        if 'Literature' in record['_collections'] or 'HAL Hidden' in record['_collections']:
-            try:
-                tei = convert_to_tei(record)
-            except Exception as e:
-                print('EXC TEI: %s %s\n' % (record['control_number'], str(e)))
-                ko += 1
+    def _read():
+        return _read_candidates(
+            since, push.last_id, limit, yield_amt, projection, shard, caches, metrics,
+            control_numbers,
+        )
+
+    candidates = prefetch(app, _read, size=yield_amt)
+    try:
+        with push:
+            to_convert = push.accept_all(candidates)
+            converted = map_in_order(
+                _convert,
+                to_convert,
+                pool=pool,
+                window=2 * converters,
+                key=lambda item: item[1][2:],
+            )
+            for (position, candidate), conversion in converted:
+                push.upload(position, candidate, conversion)
+    finally:
+        candidates.close()
+        get_pool().close()
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    seconds = time.time() - start
+    now = str(datetime.timedelta(seconds=seconds))
+
+    if not pool:
+        # The caches of the conversion processes are not visible from here.
+        caches = caches + [get_name_cache()]
+
+    timings = {
+        'conversion': push.conversion_seconds,
+        'language detection': push.language_seconds,
+    }
+
+    records = metrics.counter('records_total', 'Records processed, by outcome.')
+    for outcome in ('ok', 'ko', 'skipped'):
+        records.inc(getattr(push, outcome), outcome=outcome)
+    metrics.gauge('duration_seconds', 'Duration of the push.').set(seconds)
+    metrics.gauge('records_per_second', 'Records processed per second.').set(
+        push.total / seconds if seconds else 0.0,
+    )
+    metrics.gauge('last_run_timestamp_seconds', 'End of the push.').set(time.time())
+
+    return PushSummary(
+        push.total, now, push.ok, push.ko, push.skipped, push.get_watermark(), caches, timings,
+        get_pool(), push.retry_policy, push.limiter, metrics,
+    )
+
+
+def get_shard_bounds(index, count):
+    """Return the range of record ids of a shard of the push.
+
+    Splits the UUID space in ``count`` ranges of the same size. As record
+    ids are random, every range holds about the same number of records.
+
+    Args:
+        index(int): the shard, from ``0`` to ``count - 1``.
+        count(int): the number of shards.
+
+    Returns:
+        Tuple[uuid.UUID, uuid.UUID]: the first id of the shard and the first
+        id of the next one, ``None`` for the last shard.
+
+    Examples:
+        >>> get_shard_bounds(1, 2)
+        (UUID('80000000-0000-0000-0000-000000000000'), None)
+
+    """
+    lower = uuid.UUID(int=index * 2 ** 128 // count)
+    upper = uuid.UUID(int=(index + 1) * 2 ** 128 // count) if index + 1 < count else None
+
+    return lower, upper
+
+
+def _new_caches(app):
+    """Return the caches of the records linked from the candidates."""
+    return [
+        LRUCache('institutions', app.config['HAL_PUSH_INSTITUTION_CACHE_SIZE']),
+        LRUCache('conferences', app.config['HAL_PUSH_CONFERENCE_CACHE_SIZE']),
+    ]
+
+
+def new_metrics():
+    """Return the metrics of a new push, with a histogram for every stage."""
+    metrics = Registry('hal_push_')
+    for stage in STAGES:
+        _get_stage(metrics, stage)
+
+    return metrics
+
+
+def _get_stage(metrics, stage):
+    return metrics.histogram(stage + '_seconds', 'Seconds spent %s.' % STAGES[stage])
+
+
+def _read_candidates(since, last_id, limit, yield_amt, projection=False, shard=None,
+                     caches=(None, None), metrics=None, control_numbers=None):
+    """Read the records to push by increasing id, as a stable order is what
+    allows resuming an interrupted push.
+
+    Records are read in pages of ``yield_amt`` starting after the last id
+    of the previous page, which makes every page as fast as the first one
+    and allows restricting the push to a ``shard`` of the ids.
+
+    Records outside of the collections pushed to HAL are filtered out by the
+    DB. With ``projection``, only the fields needed to push a record are
+    sent over the wire instead of the full record.
+
+    The records linked from a page are fetched along with it, with one query
+    for all its institutions and one for all its conferences, skipping those
+    already in the ``caches`` of institutions and conferences.
+
+    The time spent reading pages and fetching linked records goes to the
+    ``metrics`` of the push. With ``control_numbers``, only the records with
+    those control numbers are read.
+    """
+    metrics = metrics or new_metrics()
+
+    if projection:
+        fields = PUSH_FIELDS + TEI_FIELDS
+        json = func.json_build_object(
+            *chain.from_iterable((field, RecordMetadata.json[field]) for field in fields)
+        )
+    else:
+        json = RecordMetadata.json
+
+    records = RecordMetadata.query.with_entities(
+        RecordMetadata.id.label('id'),
+        RecordMetadata.updated.label('updated'),
+        json.label('json'),
+    ).filter(
+        RecordMetadata.json['_export_to'].op('@>')('{"HAL": true}'),
+        RecordMetadata.json['_collections'].op('?|')(array(PUSHED_COLLECTIONS)),
+    )
+
+    if since:
+        records = records.filter(RecordMetadata.updated > since)
+
+    if control_numbers is not None:
+        records = records.join(
+            PersistentIdentifier,
+            RecordMetadata.id == PersistentIdentifier.object_uuid,
+        ).filter(
+            PersistentIdentifier.object_type == 'rec',
+            PersistentIdentifier.pid_type == 'lit',
+            PersistentIdentifier.pid_value.in_([str(value) for value in control_numbers]),
+        )
+
+    if shard:
+        lower, upper = get_shard_bounds(*shard)
+        records = records.filter(RecordMetadata.id >= lower)
+        if upper:
+            records = records.filter(RecordMetadata.id < upper)
+
+    last_id = uuid.UUID(last_id) if last_id else None
+    remaining = limit if limit > 0 else None
+
+    try:
+        while remaining is None or remaining > 0:
+            page_size = yield_amt if remaining is None else min(yield_amt, remaining)
+
+            page = records
+            if last_id:
+                page = page.filter(RecordMetadata.id > last_id)
+            with _get_stage(metrics, 'db_fetch').time():
+                rows = page.order_by(RecordMetadata.id).limit(page_size).all()
+
+            records_json = [row.json for row in rows]
+            if projection:
+                # Fields missing from the record are projected as nulls.
+                records_json = [
+                    {key: value for key, value in record.items() if value is not None}
+                    for record in records_json
+                ]
+            with _get_stage(metrics, 'reference_resolution').time():
+                linked = get_linked_records(records_json, *caches)
+
+            # Do not keep a transaction open between pages for the whole push.
+            db.session.rollback()
+
+            for row, record, (hal_id_map, conference_records) in zip(rows, records_json, linked):
+                yield Candidate(row.id, row.updated, record, hal_id_map, conference_records)
+
+            if len(rows) < page_size:
+                break
+
+            last_id = rows[-1].id
+            if remaining is not None:
+                remaining -= len(rows)
+    finally:
+        db.session.remove()
+
+
+def _new_converter_pool(app, converters):
+    config = {key: value for key, value in app.config.items() if key.startswith('HAL_')}
+
+    return multiprocessing.Pool(converters, initializer=_init_converter, initargs=(config,))
+
+
+def _init_converter(config):
+    """Set up a conversion process with the configuration of the push.
+
+    The linked records come with the candidates and the templates are
+    rendered without Flask, so conversions need neither the DB nor the
+    Invenio application: the configuration of the push just replaces the
+    defaults read by :func:`~inspire_hal.utils.get_config`.
+    """
+    from inspire_hal import config as defaults
+
+    for key, value in config.items():
+        setattr(defaults, key, value)
+
+
+def _convert(args):
+    """Convert a record to TEI, returning the error instead of raising it as
+    it might not survive being sent back from a conversion process.
+
+    The time spent is measured here, as the statistics of the conversion
+    processes are not visible from the main one.
+    """
+    record, hal_id_map, conference_records = args
+    start = time.time()
+    language_start = language.stats.seconds
+
+    try:
+        buffer = io.BytesIO()
+        write_tei(record, buffer, hal_id_map, conference_records)
+        tei, error = buffer.getvalue(), None
+    except Exception as e:
+        tei, error = None, str(e)
+
+    return Conversion(
+        tei, error, time.time() - start, language.stats.seconds - language_start,
+    )
+
+
+class _Push(object):
+    """State of a push, whose uploads run on a pool of worker threads.
+
+    Keeps at most two uploads queued per worker, so that the reading and
+    the conversion stages stay ahead of HAL without buffering the whole run.
+    Candidates are accepted and outcomes collected on the calling thread,
+    which is the only one touching the counters and the ledger.
+
+    The outcome of the records is written to the ``outcome_log``, if any.
+
+    Records are processed by increasing id. Every ``HAL_PUSH_CHECKPOINT_EVERY``
+    records, the id up to which all records are done is saved along with the
+    outcome of the records done after it, as uploads finish out of order.
+    """
+
+    def __init__(self, app, workers, since=None, ledger=None, force=False,
+                 checkpoint_file=None, archive=None, outcome_log=None):
+        self.app = app
+        self.archive = archive
+        self.outcome_log = outcome_log
+        self.since = since
+        self.ledger = ledger
+        self.force = force
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_every = app.config['HAL_PUSH_CHECKPOINT_EVERY']
+        self.fulltext = app.config['HAL_PUSH_FULLTEXT']
+        self.fulltext_base_url = app.config['HAL_PUSH_FULLTEXT_BASE_URL']
+        self.retry_policy = RetryPolicy(
+            attempts=app.config['HAL_PUSH_RETRY_ATTEMPTS'],
+            base_delay=app.config['HAL_PUSH_RETRY_BASE_DELAY'],
+            max_delay=app.config['HAL_PUSH_RETRY_MAX_DELAY'],
+            budget=app.config['HAL_PUSH_RETRY_BUDGET'],
+        )
+        self.limiter = _new_limiter(app, workers)
+        self.metrics = new_metrics()
+
+        self.started_at = datetime.datetime.utcnow()
+        self.total = self.ok = self.ko = self.skipped = 0
+        self.conversion_seconds = self.language_seconds = 0.0
+        self.last_updated = None
+        self.oldest_failed_updated = None
+        self.last_id = None
+        self.done = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._max_pending = 2 * workers
+        self._pending = {}
+        self._outcomes = OrderedDict()
+
+    @classmethod
+    def from_checkpoint(cls, app, workers, checkpoint_file, ledger=None, force=False,
+                        outcome_log=None):
+        """Return the state of the push saved in a checkpoint, if any."""
+        checkpoint = load_checkpoint(checkpoint_file)
+        if not checkpoint:
+            return None
+
+        push = cls(app, workers, since=checkpoint['since'], ledger=ledger,
+                   force=force, checkpoint_file=checkpoint_file, outcome_log=outcome_log)
+        push.started_at = checkpoint['started_at']
+        push.total = checkpoint['total']
+        push.ok = checkpoint['ok']
+        push.ko = checkpoint['ko']
+        push.skipped = checkpoint['skipped']
+        push.last_updated = checkpoint['last_updated']
+        push.oldest_failed_updated = checkpoint['oldest_failed_updated']
+        push.last_id = checkpoint['last_id']
+        push.done = checkpoint['done']
+
+        return push
+
+    def accept_all(self, candidates):
+        """Register the candidates in order, yielding those to convert.
+
+        Yields:
+            Tuple[int, Candidate]: the position of the candidate in the push
+            and the candidate.
+        """
+        for candidate in candidates:
+            if self.total and self.total % self.checkpoint_every == 0:
+                self.save_checkpoint()
+
+            position = self.total
+            self.total += 1
+
+            record_id = str(candidate.id)
+            self._outcomes[record_id] = None
+
+            if record_id in self.done:
+                # Already done before the push was interrupted.
+                self._finish(record_id, self.done.pop(record_id))
                 continue
 
-            success = False
-            for _ in range(2):
-                try:
-                    hal_id = ''
-                    ids = record.get('external_system_identifiers', [])
-
-                    for id_ in ids:
-                        if id_['schema'] == 'HAL':
-                            hal_id = id_['value']
-
-                    if hal_id:
-                        rec, idd = tei.encode('utf8'), hal_id.encode('utf8')
-                        update(rec, idd)
-                        print('UPD: %s %s\n' % (record['control_number'], hal_id))
-                    else:
-                        rec = tei.encode('utf8')
-                        receipt = create(rec)
-                        print('NEW: %s %s\n' % (record['control_number'], receipt.id))
-
-                    success = True
-                    break
-
-                except Exception as e:
-                    continue
-
-            if success:
-                print('%s) OK %s\n' % (total, record['control_number']))
-                ok += 1
+            if self.last_updated is None or candidate.updated > self.last_updated:
+                self.last_updated = candidate.updated
+
+            collections = candidate.json['_collections']
+            if any(collection in collections for collection in PUSHED_COLLECTIONS):
+                yield position, candidate
             else:
+                self._finish(record_id, 'ignored')
+
+    def upload(self, position, candidate, conversion):
+        record_id = str(candidate.id)
+        record = candidate.json
+
+        self.conversion_seconds += conversion.seconds
+        self.language_seconds += conversion.language_seconds
+        _get_stage(self.metrics, 'language_detection').observe(conversion.language_seconds)
+        _get_stage(self.metrics, 'rendering').observe(
+            conversion.seconds - conversion.language_seconds,
+        )
+
+        if conversion.error:
+            print('EXC TEI: %s %s\n' % (record['control_number'], conversion.error))
+            hal_id = _get_hal_id(record)
+            self._log(record['control_number'], 'update' if hal_id else 'create', hal_id,
+                      error='conversion', message=conversion.error)
+            self.ko += 1
+            self._finish(record_id, 'ko')
+            return
+
+        if self.archive:
+            self.archive.add(record['control_number'], conversion.tei)
+            self.ok += 1
+            self._finish(record_id, 'ok')
+            return
+
+        self._submit(position, record_id, candidate.updated, record, conversion.tei)
+
+    def _submit(self, position, record_id, updated, record, tei):
+        control_number = record['control_number']
+        hal_id = _get_hal_id(record)
+
+        fulltext_url = None
+        if self.fulltext:
+            try:
+                fulltext_url = get_fulltext_url(record, self.fulltext_base_url)
+            except ValueError as e:
+                # The record is still worth pushing without its full text.
+                print('WARN FULLTEXT: %s %s\n' % (control_number, e))
+
+        # A new full text is uploaded even if the TEI did not change.
+        fingerprint = get_fingerprint(tei + b'\n' + fulltext_url.encode('utf8')) \
+            if fulltext_url else get_fingerprint(tei)
+
+        entry = self.ledger.get(control_number) if self.ledger else None
+        if entry:
+            # The record was created by a previous push but its HAL
+            # identifier is not in INSPIRE yet: update it instead of
+            # creating a duplicate.
+            hal_id = hal_id or entry.hal_id
 
-                print(
-                    '%s) EXC HAL: %s %s\n' % (total, record['control_number'], format_error(e))
-                )
-                ko += 1
+            if not self.force and entry == (hal_id, fingerprint):
+                print('%s) SKIP %s\n' % (position, control_number))
+                self._log(control_number, 'skip', hal_id)
+                self.skipped += 1
+                self._finish(record_id, 'skipped')
+                return
 
-    return total + 1, now, ok, ko
+        if len(self._pending) >= self._max_pending:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        future = self._executor.submit(
+            _push_record, self.app, control_number, tei, hal_id, fulltext_url,
+            self.retry_policy, self.limiter, self.metrics,
+        )
+        action = 'update' if hal_id else 'create'
+        self._pending[future] = (position, record_id, control_number, updated, fingerprint, action)
+
+    def _collect(self, done):
+        for future in done:
+            position, record_id, control_number, updated, fingerprint, action = \
+                self._pending.pop(future)
+            hal_id, error, seconds = future.result()
+
+            if error is None:
+                print('%s) OK %s\n' % (position, control_number))
+                self._log(control_number, action, hal_id, seconds)
+                if self.ledger:
+                    self.ledger.set(control_number, hal_id, fingerprint, created=action == 'create')
+                self.ok += 1
+                self._finish(record_id, 'ok')
+            else:
+                print('%s) EXC HAL: %s %s\n' % (position, control_number, format_error(error)))
+                self._log(control_number, action, hal_id, seconds, classify(error),
+                          format_error(error))
+                if self.oldest_failed_updated is None or updated < self.oldest_failed_updated:
+                    self.oldest_failed_updated = updated
+                self.ko += 1
+                self._finish(record_id, 'ko')
+
+    def _log(self, control_number, action, hal_id=None, seconds=None, error=None,
+             message=None):
+        if self.outcome_log:
+            self.outcome_log.write(control_number, action, hal_id, seconds, error, message)
+
+    def _finish(self, record_id, outcome):
+        self._outcomes[record_id] = outcome
+        while self._outcomes:
+            first_id, first_outcome = next(iter(self._outcomes.items()))
+            if first_outcome is None:
+                break
+            del self._outcomes[first_id]
+            self.last_id = first_id
+
+    def save_checkpoint(self):
+        # The checkpoint must not get ahead of the ledger.
+        if self.ledger:
+            self.ledger.commit()
+
+        if not self.checkpoint_file:
+            return
+
+        # Records after last_id are scanned again when resuming, so they are
+        # not counted yet.
+        done = dict(self.done)
+        done.update(
+            (record_id, outcome) for record_id, outcome in self._outcomes.items() if outcome
+        )
+        save_checkpoint(self.checkpoint_file, {
+            'since': self.since,
+            'started_at': self.started_at,
+            'total': self.total - len(self._outcomes),
+            'ok': self.ok,
+            'ko': self.ko,
+            'skipped': self.skipped,
+            'last_updated': self.last_updated,
+            'oldest_failed_updated': self.oldest_failed_updated,
+            'last_id': self.last_id,
+            'done': done,
+        })
+
+    def get_watermark(self):
+        """Return the date up to which all the records of the push are on HAL.
+
+        Records whose upload failed must be selected again by the next push,
+        so the watermark stays just before the oldest of them. Records that
+        could not be converted to TEI do not hold it back: they will fail in
+        the same way until they are modified, which moves them past the
+        watermark anyway. The watermark never goes beyond the start of the
+        push, as records modified while it was running might have been
+        scanned before the change.
+        """
+        if self.last_updated is None:
+            return self.since
+
+        watermark = min(self.last_updated, self.started_at)
+        if self.oldest_failed_updated:
+            oldest_failure = self.oldest_failed_updated - datetime.timedelta(microseconds=1)
+            watermark = min(watermark, oldest_failure)
+
+        return watermark
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        done, _ = wait(self._pending)
+        self._collect(done)
+        self._executor.shutdown()
+        if self.ledger:
+            self.ledger.commit()
+
+        if exc_type is None:
+            if self.checkpoint_file:
+                clear_checkpoint(self.checkpoint_file)
+        else:
+            self.save_checkpoint()
+
+
+def _new_limiter(app, workers):
+    rate = app.config['HAL_PUSH_RATE_LIMIT']
+    bucket = TokenBucket(rate, app.config['HAL_PUSH_RATE_BURST']) if rate else None
+
+    return AdaptiveLimiter(
+        minimum=min(workers, app.config['HAL_PUSH_MIN_CONCURRENCY']),
+        maximum=workers,
+        target_latency=app.config['HAL_PUSH_TARGET_LATENCY'],
+        bucket=bucket,
+    )
+
+
+def _push_record(app, control_number, tei, hal_id, fulltext_url=None, retry_policy=None,
+                 limiter=None, metrics=None):
+    """Upload a record to HAL, retrying as long as the failures are transient.
+
+    Runs in a worker thread, so it needs its own application context to
+    access the HAL configuration. The full text at ``fulltext_url``, if
+    any, is zipped with the TEI once as it is downloaded, and the zip is
+    sent by every attempt, each of them waiting for the ``limiter`` to
+    allow it. The time spent uploading and
+    waiting to retry goes to the ``metrics`` of the push.
+
+    Returns:
+        Tuple[str, Exception, float]: the HAL identifier of the record, the
+        last error if the upload failed, and the seconds the upload took.
+    """
+    start = time.time()
+    retry_policy = retry_policy or RetryPolicy()
+    limiter = limiter or AdaptiveLimiter()
+    metrics = metrics or new_metrics()
+    upload_seconds = _get_stage(metrics, 'upload')
+
+    def _upload(func, *args):
+        with upload_seconds.time():
+            return func(*args)
+
+    def _on_retry(error, delay):
+        print('RETRY: %s in %.1fs after %s\n' % (control_number, delay, format_error(error)))
+        metrics.counter('retries_total', 'Retries of uploads, by kind of failure.').inc(
+            kind=classify(error),
+        )
+        _get_stage(metrics, 'retry_delay').observe(delay)
+
+    with app.app_context():
+        try:
+            with _open_package(tei, fulltext_url) as package:
+                if hal_id:
+                    retry_policy.call(
+                        lambda: limiter.call(
+                            lambda: _upload(update, tei, hal_id.encode('utf8'), package),
+                        ),
+                        _on_retry,
+                    )
+                    print('UPD: %s %s\n' % (control_number, hal_id))
+                else:
+                    receipt = retry_policy.call(
+                        lambda: limiter.call(lambda: _upload(create, tei, package)),
+                        _on_retry,
+                    )
+                    hal_id = receipt.id
+                    print('NEW: %s %s\n' % (control_number, hal_id))
+
+            return hal_id, None, time.time() - start
+
+        except Exception as e:
+            return hal_id, e, time.time() - start
+
+
+@contextmanager
+def _open_package(tei, fulltext_url):
+    if not fulltext_url:
+        yield None
+        return
+
+    with open_fulltext(fulltext_url) as fulltext, open_package(tei, fulltext) as package:
+        yield package
 
 
 def format_error(exception):
+    """Return the description of a failed upload, as text.
+
+    Uses the description given by HAL in its SWORD error document, if any,
+    and the exception itself otherwise.
+    """
     try:
         if exception.content:
             root = etree.fromstring(exception.content)
@@ -115,4 +764,4 @@ def format_error(exception):
         else:
             return 'Error %d' % exception.response['status']
     except Exception:
-        return exception
+        return u'%s' % (exception,) or type(exception).__name__
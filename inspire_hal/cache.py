@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Caches shared by the records of a push."""
+
+from __future__ import absolute_import, division, print_function
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread-safe cache dropping the least recently used entries.
+
+    Counts the lookups that found an entry and those that did not, to tell
+    whether the cache is worth its size.
+
+    Args:
+        name(str): what is cached, used when reporting the statistics.
+        maxsize(int): maximum number of entries kept.
+
+    Examples:
+        >>> cache = LRUCache('institutions', maxsize=2)
+        >>> cache.set(902725, '300037')
+        >>> cache.get(902725)
+        '300037'
+        >>> cache.hits, cache.misses
+        (1, 0)
+
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the entry of a key, marking it as the most recently used.
+
+        Args:
+            key: the key.
+            default: returned when the key is not cached. Cached values can
+                be ``None``, so pass a sentinel to tell both cases apart.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all the entries, keeping the statistics."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        """Return the share of lookups that found an entry."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return '%s cache: %d hits, %d misses (%.1f%% hits)' % (
+            self.name, self.hits, self.misses, 100 * self.hit_rate,
+        )
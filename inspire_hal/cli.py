@@ -23,6 +23,7 @@
 """INSPIRE-HAL cli."""
 from __future__ import absolute_import, division, print_function
 
+import os
 import sys
 
 import click
@@ -30,7 +31,9 @@ import click
 from flask import current_app
 from flask.cli import with_appcontext
 
-from inspire_hal.tasks import hal_push
+from inspire_hal.index import DEFAULT_FILE as DEFAULT_INDEX_FILE, build_index
+from inspire_hal.state import load_watermark, parse_datetime
+from inspire_hal.tasks import hal_dry_run, hal_push
 
 
 def get_env_var(var_name):
@@ -42,46 +45,231 @@ def get_env_var(var_name):
         sys.exit(1)
 
 
+def configure_db():
+    """Point the application to the INSPIRE DB set in the environment."""
+    db_user = get_env_var('DB_INSPIRE_USER')
+    db_pass = get_env_var('DB_INSPIRE_PASSWORD')
+    db_port = get_env_var('DB_PORT')
+    db_uri = get_env_var('PROD_DB_HOST')
+
+    db_resource = 'postgresql+psycopg2://{}:{}@{}:{}/inspirehep'.\
+        format(db_user, db_pass, db_uri, db_port)
+
+    current_app.config.update(SQLALCHEMY_DATABASE_URI=db_resource)
+
+
+def get_state_file(var_name, default_name, shard=None):
+    """Return the path of a file keeping state between pushes.
+
+    Defaults to ``default_name`` inside the instance path when the
+    configuration variable ``var_name`` is not set. Every shard of the push
+    keeps its own state.
+    """
+    path = current_app.config.get(var_name) or \
+        os.path.join(current_app.instance_path, default_name)
+
+    if shard:
+        path = '{}.shard-{}-of-{}'.format(path, *shard)
+
+    return path
+
+
+def parse_shard(value):
+    """Parse a shard given as ``INDEX/COUNT``, with INDEX from 0 to COUNT - 1.
+
+    Examples:
+        >>> parse_shard('0/4')
+        (0, 4)
+
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError('Shards must be given as INDEX/COUNT: %s' % value)
+
+    if not 0 <= index < count:
+        raise ValueError('Shard index must be between 0 and %s: %s' % (count - 1, value))
+
+    return index, count
+
+
+def _parse_since(ctx, param, value):
+    if value is None:
+        return None
+
+    try:
+        return parse_datetime(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _parse_shard(ctx, param, value):
+    if value is None:
+        return None
+
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 @click.group()
 def hal():
     pass
 
 
 @hal.command()
+@click.option('--workers', type=int, help='Number of concurrent uploads to HAL.')
+@click.option('--converters', type=int,
+              help='Number of processes converting records to TEI, 0 to convert them in the main process.')
+@click.option('--since', callback=_parse_since,
+              help='Only push records modified after this date (YYYY-MM-DD[THH:MM:SS]).')
+@click.option('--incremental', is_flag=True,
+              help='Only push records modified since the last complete push.')
+@click.option('--force', is_flag=True,
+              help='Upload records even if their TEI did not change since their last upload.')
+@click.option('--resume', is_flag=True,
+              help='Continue the last push from where it was interrupted.')
+@click.option('--shard', callback=_parse_shard,
+              help='Only push the INDEX-th of COUNT slices of the records (INDEX/COUNT, from 0).')
+@click.option('--dry-run', is_flag=True,
+              help='Convert the records without uploading them, writing their TEI to --output.')
+@click.option('--output', type=click.Path(file_okay=False),
+              help='Directory of the TEI archive written by --dry-run.')
+@click.option('--retry-failed', type=click.Path(exists=True, dir_okay=False), metavar='LOG',
+              help='Only push the records whose last outcome in this outcome log is a failure.')
 @with_appcontext
-def push():
+def push(workers, converters, since, incremental, force, resume, shard, dry_run, output,
+         retry_failed):
     """Push to HAL api.
 
     By default the push is done to the HAL **preprod** environment.
     To push to the production environment overwrite in the environment the
     variables `APP_HAL_COL_IRI` and `HAL_EDIT_IRI`.
+
+    Every complete push saves the date of the most recent record it pushed,
+    so that ``--incremental`` only pushes the records modified afterwards.
+    Records whose TEI is identical to their last upload are skipped, unless
+    ``--force`` is given. A push that was interrupted can be continued with
+    ``--resume``, which uses the same selection of records.
+
+    The records can be split between several hosts with ``--shard``, each
+    of them pushing a disjoint slice and keeping its own state.
+
+    With ``--dry-run``, nothing is uploaded: the TEI of the records is
+    written to compressed shards in ``--output``, along with an index of
+    where each record is, and the conversion throughput is reported. The
+    state of the pushes is neither used nor changed, so ``--resume`` and
+    ``--force`` cannot be used, and ``--output`` must be new or empty.
+
+    The outcome of every record is logged, one JSON object per line, and
+    the records that failed can be pushed again with ``--retry-failed``
+    followed by the log. Such a push does not move the date used by
+    ``--incremental`` and cannot be resumed.
     """
+    if dry_run and not output:
+        raise click.UsageError('--dry-run requires --output.')
+    if dry_run and (resume or force):
+        raise click.UsageError('--dry-run cannot be combined with --resume or --force.')
+    if dry_run and os.path.isdir(output) and os.listdir(output):
+        # The shards of another run would be mixed with those of this one.
+        raise click.UsageError('--output must be a new or empty directory: %s' % output)
+    if retry_failed and (since or incremental or resume or dry_run):
+        raise click.UsageError(
+            '--retry-failed cannot be combined with --since, --incremental, --resume or --dry-run.'
+        )
+
     print('Loading credentials and settings from local environment')
 
-    username = get_env_var('HAL_USER_NAME')
-    password = get_env_var('HAL_USER_PASS')
-    db_user = get_env_var('DB_INSPIRE_USER')
-    db_pass = get_env_var('DB_INSPIRE_PASSWORD')
-    db_port = get_env_var('DB_PORT')
-    db_uri = get_env_var('PROD_DB_HOST')
+    configure_db()
 
     # Optional configurations
     limit = current_app.config.get('HAL_LIMIT', 0)
     yield_amt = current_app.config.get('HAL_YIELD_AMT', 100)
+    workers = workers or current_app.config['HAL_PUSH_WORKERS']
+    if converters is None:
+        converters = current_app.config['HAL_PUSH_CONVERTERS']
+    if shard is None and current_app.config.get('HAL_PUSH_SHARD'):
+        shard = parse_shard(current_app.config['HAL_PUSH_SHARD'])
+    watermark_file = get_state_file('HAL_PUSH_WATERMARK_FILE', 'hal-push-watermark.json', shard)
+    ledger_file = get_state_file('HAL_PUSH_LEDGER_FILE', 'hal-push-ledger.sqlite', shard)
+    checkpoint_file = get_state_file('HAL_PUSH_CHECKPOINT_FILE', 'hal-push-checkpoint.json', shard)
+    outcome_log_file = get_state_file('HAL_PUSH_OUTCOME_LOG_FILE', 'hal-push-outcomes.jsonl', shard)
+    metrics_file = current_app.config['HAL_PUSH_METRICS_FILE']
+    if metrics_file and shard:
+        root, extension = os.path.splitext(metrics_file)
+        metrics_file = '{}.shard-{}-of-{}{}'.format(root, shard[0], shard[1], extension)
+    # Read by the conversions, possibly in other processes, from the config.
+    current_app.config['HAL_INSTITUTION_INDEX_FILE'] = get_state_file(
+        'HAL_INSTITUTION_INDEX_FILE', DEFAULT_INDEX_FILE,
+    )
 
-    db_resource = 'postgresql+psycopg2://{}:{}@{}:{}/inspirehep'.\
-        format(db_user, db_pass, db_uri, db_port)
+    if incremental and not since:
+        since = load_watermark(watermark_file)
+        if since:
+            print('Pushing records modified after %s' % since.isoformat())
+        else:
+            print('No previous push found, pushing all records')
+
+    if dry_run:
+        hal_dry_run(
+            limit=limit,
+            yield_amt=yield_amt,
+            output=output,
+            records_per_shard=current_app.config['HAL_PUSH_ARCHIVE_SHARD_SIZE'],
+            since=since,
+            converters=converters,
+            shard=shard,
+        )
+        return
+
+    username = get_env_var('HAL_USER_NAME')
+    password = get_env_var('HAL_USER_PASS')
 
     current_app.config.update(
         HAL_USER_NAME=username,
         HAL_USER_PASS=password,
-        SQLALCHEMY_DATABASE_URI=db_resource
     )
 
+    if retry_failed:
+        # Retrying a few records must leave the state of the last complete
+        # or interrupted push alone.
+        watermark_file = checkpoint_file = None
+
     try:
-        hal_push(limit=limit, yield_amt=yield_amt)
+        hal_push(
+            limit=limit,
+            yield_amt=yield_amt,
+            workers=workers,
+            since=since,
+            watermark_file=watermark_file,
+            ledger_file=ledger_file,
+            force=force,
+            checkpoint_file=checkpoint_file,
+            resume=resume,
+            converters=converters,
+            shard=shard,
+            metrics_file=metrics_file,
+            outcome_log_file=outcome_log_file,
+            retry_failed=retry_failed,
+        )
 
     except Exception as e:
         print ('ERROR: cannot connect to DB. Quitting.')
         print ('Exception:\n\n' + e.message)
 
+
+@hal.command('build-index')
+@with_appcontext
+def build_index_command():
+    """Build the index of the HAL identifiers of the institutions.
+
+    The index is written to `HAL_INSTITUTION_INDEX_FILE`, by default
+    `hal-institution-index.bin` in the instance path. Pushes read the HAL
+    identifiers of the institutions from it instead of querying the DB.
+    """
+    configure_db()
+    path = get_state_file('HAL_INSTITUTION_INDEX_FILE', DEFAULT_INDEX_FILE)
+
+    count = build_index(path)
+    print('Indexed %s institutions in %s' % (count, path))
@@ -48,6 +48,19 @@ HAL_DOMAIN_MAPPING = {
 }
 """Mapping used when converting from INSPIRE categories to HAL domains."""
 
+HAL_AUTHOR_NAME_CACHE_SIZE = 100000
+"""Number of parsed author names kept by each process converting records."""
+
+HAL_TEI_BYTECODE_CACHE_DIR = None
+"""Directory keeping the compiled TEI templates.
+
+Note:
+
+    Defaults to the temporary directory of the system. Processes converting
+    records load the compiled templates from it instead of compiling them.
+
+"""
+
 
 #
 # Configuration used when connecting to HAL.
@@ -99,3 +112,265 @@ Note:
 
 HAL_IGNORE_CERTIFICATES = False
 """Whether to check certificates when connecting to HAL."""
+
+HAL_SWORD_POOL_SIZE = 8
+"""Number of idle connections to HAL kept for the next uploads.
+
+Note:
+
+    Should be at least ``HAL_PUSH_WORKERS``, otherwise some uploads open a
+    new connection.
+
+"""
+
+HAL_SWORD_IDLE_TIMEOUT = 30
+"""Seconds after which an idle connection to HAL is closed."""
+
+HAL_SWORD_HTTP_CACHE = None
+"""Where to cache the HTTP responses of HAL.
+
+Note:
+
+    ``None`` disables the cache, ``'memory'`` keeps up to
+    ``HAL_SWORD_HTTP_CACHE_SIZE`` responses in memory and any other value
+    is a directory holding up to ``HAL_SWORD_HTTP_CACHE_MAX_BYTES`` of
+    responses. Deposits are never cached, so the cache only costs time
+    during a push, which is why it is disabled by default.
+
+"""
+
+HAL_SWORD_HTTP_CACHE_SIZE = 1000
+"""Number of HTTP responses of HAL cached in memory."""
+
+HAL_SWORD_HTTP_CACHE_MAX_BYTES = 100 * 1024 * 1024
+"""Maximum total size of the HTTP responses of HAL cached in a directory."""
+
+HAL_SWORD_SPOOL_MAX_BYTES = 10 * 1024 * 1024
+"""Size up to which the zip of a deposit with its full text is kept in memory.
+
+Note:
+
+    Larger deposits are written to a temporary file as their full text is
+    downloaded, so each upload worker holds at most this much in memory.
+
+"""
+
+
+#
+# Configuration used when pushing records in bulk.
+#
+
+HAL_PUSH_WORKERS = 1
+"""Number of records uploaded concurrently to HAL during a bulk push.
+
+Note:
+
+    Can be overridden for a single run with the ``--workers`` option of
+    ``hal push``.
+
+"""
+
+HAL_PUSH_CONVERTERS = 0
+"""Number of processes converting records to TEI during a bulk push.
+
+Note:
+
+    ``0`` converts the records in the main process. Can be overridden for a
+    single run with the ``--converters`` option of ``hal push``. Records are
+    read from the DB in a background thread in any case, keeping at most
+    ``HAL_YIELD_AMT`` of them ahead of the conversion.
+
+"""
+
+HAL_PUSH_SHARD = None
+"""Slice of the records pushed by this host, as ``INDEX/COUNT``.
+
+Note:
+
+    Records are split in ``COUNT`` ranges of ids, ``INDEX`` going from ``0``
+    to ``COUNT - 1``, so that several hosts can push in parallel. Can be
+    overridden for a single run with the ``--shard`` option of ``hal push``.
+
+"""
+
+HAL_PUSH_PROJECTION = False
+"""Whether to only read from the DB the fields needed to push a record.
+
+Note:
+
+    Saves transferring and deserializing the large fields of the records
+    that are not converted to TEI, like ``references`` or ``figures``. The
+    fields read are ``PUSH_FIELDS`` in ``inspire_hal.bulk_push`` and
+    ``TEI_FIELDS`` in ``inspire_hal.core.tei``, which must be kept up to date
+    with the conversion.
+
+"""
+
+HAL_PUSH_WATERMARK_FILE = None
+"""File keeping the ``updated`` date up to which all records were pushed.
+
+Note:
+
+    Defaults to ``hal-push-watermark.json`` in the instance path. Read by
+    ``hal push --incremental`` to only push the records modified since.
+
+"""
+
+HAL_PUSH_LEDGER_FILE = None
+"""SQLite database keeping the HAL identifier and a fingerprint of the TEI
+last uploaded for each record.
+
+Note:
+
+    Defaults to ``hal-push-ledger.sqlite`` in the instance path. Records
+    whose TEI did not change since their last upload are skipped, unless
+    ``hal push --force`` is used.
+
+"""
+
+HAL_PUSH_CHECKPOINT_FILE = None
+"""File keeping the progress of a running push.
+
+Note:
+
+    Defaults to ``hal-push-checkpoint.json`` in the instance path. It is
+    removed once the push completes; ``hal push --resume`` continues an
+    interrupted push from it.
+
+"""
+
+HAL_PUSH_CHECKPOINT_EVERY = 100
+"""Number of records processed between two saves of the checkpoint."""
+
+HAL_PUSH_INSTITUTION_CACHE_SIZE = 10000
+"""Number of institutions whose HAL identifier is kept during a push.
+
+Note:
+
+    The same institutions are linked from a large share of the records, so
+    they are only queried the first time they are met. The hit rate of the
+    cache is reported at the end of the push.
+
+"""
+
+HAL_PUSH_CONFERENCE_CACHE_SIZE = 1000
+"""Number of Conference records kept during a push."""
+
+HAL_PUSH_RETRY_ATTEMPTS = 3
+"""Maximum number of attempts of an upload.
+
+Note:
+
+    Only the uploads that failed because of a timeout, a connection error,
+    a 5xx response or a 429 response are retried. HAL rejecting the TEI is
+    not retried.
+
+"""
+
+HAL_PUSH_RETRY_BASE_DELAY = 1.0
+"""Upper bound of the seconds before the first retry of an upload.
+
+Note:
+
+    The bound is doubled at every retry, up to ``HAL_PUSH_RETRY_MAX_DELAY``.
+    The delay is drawn between 0 and the bound (full jitter), so it is half
+    of it on average.
+
+"""
+
+HAL_PUSH_RETRY_MAX_DELAY = 60.0
+"""Maximum seconds before retrying an upload."""
+
+HAL_PUSH_RETRY_BUDGET = 1000
+"""Maximum number of retries of a push, ``None`` for no limit.
+
+Note:
+
+    Once the budget is spent, failed uploads are not retried anymore: when
+    HAL is down, the push fails fast instead of waiting for every record.
+
+"""
+
+HAL_PUSH_RATE_LIMIT = None
+"""Maximum number of requests per second sent to HAL, ``None`` for no limit."""
+
+HAL_PUSH_RATE_BURST = 5
+"""Number of requests sent to HAL at once after a pause, within the rate limit."""
+
+HAL_PUSH_MIN_CONCURRENCY = 1
+"""Number of concurrent uploads a push starts with.
+
+Note:
+
+    The number of concurrent uploads grows up to the number of workers as
+    long as HAL keeps up, and is halved, down to this number, when HAL
+    throttles the uploads, fails with a server error or times out, or takes
+    more than ``HAL_PUSH_TARGET_LATENCY`` to answer.
+
+"""
+
+HAL_PUSH_TARGET_LATENCY = 20.0
+"""Seconds above which an upload is taken as a sign that HAL is overloaded.
+
+Note:
+
+    ``None`` to only reduce the concurrency on failures.
+
+"""
+
+HAL_PUSH_FULLTEXT = False
+"""Whether to attach the full text of the records to their deposits.
+
+Note:
+
+    The full text is the first PDF document of a record that is marked as
+    ``fulltext`` and is not ``hidden``. It is downloaded by the upload
+    worker, relative URLs being resolved against ``HAL_PUSH_FULLTEXT_BASE_URL``.
+    Full texts that are not at an ``http(s)`` URL are left out, with a
+    warning.
+
+"""
+
+HAL_PUSH_FULLTEXT_BASE_URL = 'https://inspirehep.net'
+"""URL the relative URLs of the documents of the records are resolved against."""
+
+HAL_PUSH_ARCHIVE_SHARD_SIZE = 10000
+"""Number of records in every shard of the archives written by ``hal push --dry-run``."""
+
+HAL_PUSH_OUTCOME_LOG_FILE = None
+"""Where to log the outcome of every record pushed, one JSON object per line.
+
+Note:
+
+    Defaults to ``hal-push-outcomes.jsonl`` in the instance path. The log of
+    a push replaces the previous one, unless the push is resumed or only
+    retries the failures of a log with ``hal push --retry-failed``.
+
+"""
+
+HAL_PUSH_METRICS_FILE = None
+"""Where to write the metrics of every push, for Prometheus.
+
+Note:
+
+    The metrics are the outcome of the records, the retries of the uploads
+    and histograms of the seconds spent in every stage of the push, in the
+    format of the textfile collector of the node exporter, so the file
+    should be named ``*.prom`` in its directory. The metrics of a shard of
+    the push are labelled with it, so that all the shards can write to the
+    same directory under different names. ``None`` to not write them.
+
+"""
+
+HAL_INSTITUTION_INDEX_FILE = None
+"""Index of the HAL identifiers of all the institutions.
+
+Note:
+
+    Written by ``hal build-index`` and read by ``hal push``, by default
+    ``hal-institution-index.bin`` in the instance path. When it exists, the
+    HAL identifiers of the institutions it contains are read from it
+    instead of the DB, so it should be rebuilt before each push.
+    Institutions created after it was built are still queried.
+
+"""
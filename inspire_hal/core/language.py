@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Language detection of the abstracts."""
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import re
+import threading
+import time
+
+from langdetect import DetectorFactory, detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+
+from ..cache import LRUCache
+
+# langdetect is random unless seeded, which would make the TEI of a record
+# change between pushes.
+DetectorFactory.seed = 0
+
+ENGLISH_STOPWORDS = frozenset([
+    'also', 'and', 'are', 'been', 'between', 'by', 'can', 'for', 'from',
+    'has', 'have', 'is', 'it', 'its', 'not', 'of', 'or', 'our', 'that',
+    'the', 'these', 'this', 'to', 'we', 'were', 'which', 'with',
+])
+"""Frequent English words that are rare in the other languages."""
+
+MIN_WORDS = 20
+"""Minimum number of words for the English heuristic to apply."""
+
+MIN_STOPWORDS_RATIO = 0.15
+"""Minimum share of English stopwords for a text to be taken as English."""
+
+MIN_CONFIDENCE = 0.9
+"""Minimum probability of the language found by ``langdetect`` for it to be
+preferred to the language declared by the record."""
+
+# Only ASCII words are counted: symbols, Greek letters and accented names
+# found in English abstracts are skipped.
+_WORD = re.compile(r'[a-z]+')
+
+_detected = LRUCache('languages', maxsize=10000)
+
+
+class DetectionStats(object):
+    """Number of detections and time spent, by way of detecting."""
+
+    def __init__(self):
+        self.counts = {}
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, method, seconds):
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            self.seconds += seconds
+
+    def __str__(self):
+        counts = ', '.join(
+            '%s %s' % (count, method) for method, count in sorted(self.counts.items())
+        )
+        return 'language detection: %.3fs (%s)' % (self.seconds, counts or 'none')
+
+
+stats = DetectionStats()
+"""Statistics of the detections made by this process."""
+
+
+def detect_language(text, declared=None):
+    """Return the language of a text.
+
+    Texts that look English are taken as such. The others are given to
+    ``langdetect``, the language declared by the record being used only
+    when ``langdetect`` fails or is not confident. Results are memoized by
+    hash of the text.
+
+    Args:
+        text(str): the text, usually an abstract.
+        declared(List[str]): the ``languages`` of the record.
+
+    Returns:
+        str: the ISO 639-1 code of the language, or ``''`` if it could not
+        be detected.
+
+    Examples:
+        >>> detect_language(u'Les corrections radiatives sont calculées.', ['fr'])
+        'fr'
+
+    """
+    if not text:
+        return ''
+
+    start = time.time()
+    key = (hashlib.sha1(text.encode('utf8')).digest(), tuple(declared or ()))
+
+    language = _detected.get(key)
+    if language is not None:
+        method = 'memoized'
+    elif _looks_english(text):
+        language, method = 'en', 'heuristic'
+    else:
+        language, method = _detect(text, declared), 'langdetect'
+        if language is None:
+            language = declared[0] if declared else ''
+            method = 'declared' if declared else method
+
+    _detected.set(key, language)
+    stats.add(method, time.time() - start)
+
+    return language
+
+
+def _detect(text, declared=None):
+    """Return the language found by ``langdetect``, ``None`` if it failed
+    or is not confident while the record declares a language."""
+    try:
+        candidates = detect_langs(text)
+    except LangDetectException:
+        return None
+
+    best = candidates[0] if candidates else None
+    if best is None or (declared and best.prob < MIN_CONFIDENCE):
+        return None
+
+    return best.lang
+
+
+def _looks_english(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return False
+
+    stopwords = sum(1 for word in words if word in ENGLISH_STOPWORDS)
+    return stopwords / len(words) >= MIN_STOPWORDS_RATIO
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Rendering of the TEI templates without a Flask application."""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import tempfile
+import threading
+
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, select_autoescape
+
+from ..utils import get_config
+
+_CHUNKS_PER_WRITE = 512
+
+_environment = None
+_lock = threading.Lock()
+
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache safe to share between processes.
+
+    Each template is written to a temporary file which is then renamed, so
+    that other processes never load a partially written template. Jinja2
+    does so itself since 3.0, but older versions write in place.
+    """
+
+    def dump_bytecode(self, bucket):
+        name = self._get_cache_filename(bucket)
+        fd, temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(name), prefix=os.path.basename(name), suffix='.tmp',
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.rename(temp_name, name)
+        except BaseException:
+            try:
+                os.remove(temp_name)
+            except OSError:
+                pass
+            raise
+
+
+def get_environment():
+    """Return the Jinja environment of the templates, created once per process.
+
+    It escapes the same templates as Flask does. Compiled templates are kept
+    in ``HAL_TEI_BYTECODE_CACHE_DIR``, so that new processes do not compile
+    them again, each written atomically.
+
+    Returns:
+        jinja2.Environment: the environment.
+    """
+    global _environment
+
+    with _lock:
+        if _environment is None:
+            _environment = Environment(
+                loader=PackageLoader('inspire_hal', 'templates'),
+                autoescape=select_autoescape(['html', 'htm', 'xml', 'xhtml']),
+                bytecode_cache=AtomicBytecodeCache(get_config('HAL_TEI_BYTECODE_CACHE_DIR')),
+            )
+
+    return _environment
+
+
+def render(template_name, **context):
+    """Render a template with the given context.
+
+    Args:
+        template_name(str): the template, relative to ``inspire_hal/templates``.
+        context: the variables of the template.
+
+    Returns:
+        str: the rendered template.
+
+    Examples:
+        >>> render('hal/preprint.xml', **TEIDocument(record).get_context())
+        <?xml version="1.0" encoding="UTF-8"?>
+        ...
+
+    """
+    return get_environment().get_template(template_name).render(**context)
+
+
+def stream(template_name, fd, encoding='utf8', **context):
+    """Render a template into a binary file, as it is generated.
+
+    Only a few chunks of the rendered template are held in memory at once,
+    instead of the whole text and then its encoded copy.
+
+    Args:
+        template_name(str): the template, relative to ``inspire_hal/templates``.
+        fd(file): the binary file written to.
+        encoding(str): the encoding of the written text.
+        context: the variables of the template.
+    """
+    chunks = []
+    for chunk in get_environment().get_template(template_name).generate(**context):
+        chunks.append(chunk)
+        if len(chunks) == _CHUNKS_PER_WRITE:
+            fd.write(u''.join(chunks).encode(encoding))
+            del chunks[:]
+
+    fd.write(u''.join(chunks).encode(encoding))
@@ -24,80 +24,407 @@
 
 from __future__ import absolute_import, division, print_function
 
-from tempfile import TemporaryFile
-from zipfile import ZIP_DEFLATED, ZipFile
+import base64
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
 
 import httplib2
 from flask import current_app
 from sword2 import Connection
-from sword2.http_layer import HttpLib2Layer
+from sword2.exceptions import HTTPResponseError
+from sword2.http_layer import HttpLib2Layer, HttpLib2Response
 
+from ..cache import LRUCache
 
-def create(tei, doc_file=None):
-    """Create a record on HAL using the SWORD2 protocol."""
-    connection = _new_connection()
-    payload, mimetype, filename = _create_payload(tei, doc_file)
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+def create(tei, package=None):
+    """Create a record on HAL using the SWORD2 protocol.
+
+    Args:
+        tei(bytes): the record formatted in XML+TEI.
+        package(file): the zip of the TEI with the full text of the record,
+            as given by :func:`open_package`, sent instead of the TEI alone.
+    """
+    payload, mimetype, filename = _get_payload(tei, package)
 
     col_iri = current_app.config['HAL_COL_IRI']
 
-    return connection.create(
-        col_iri=col_iri,
-        payload=payload,
-        mimetype=mimetype,
-        filename=filename,
-        packaging='http://purl.org/net/sword-types/AOfr',
-        in_progress=False,
-    )
+    with get_pool().connection() as connection:
+        return connection.create(
+            col_iri=col_iri,
+            payload=payload,
+            mimetype=mimetype,
+            filename=filename,
+            packaging='http://purl.org/net/sword-types/AOfr',
+            in_progress=False,
+        )
 
 
-def update(tei, hal_id, doc_file=None):
-    """Update a record on HAL using the SWORD2 protocol."""
-    connection = _new_connection()
-    payload, mimetype, filename = _create_payload(tei, doc_file)
+def update(tei, hal_id, package=None):
+    """Update a record on HAL using the SWORD2 protocol.
+
+    The arguments are those of :func:`create`, along with the HAL
+    identifier of the record.
+    """
+    payload, mimetype, filename = _get_payload(tei, package)
 
     edit_iri = current_app.config['HAL_EDIT_IRI'] + hal_id
     edit_media_iri = edit_iri
 
-    return connection.update(
-        edit_iri=edit_iri,
-        edit_media_iri=edit_media_iri,
-        payload=payload,
-        mimetype=mimetype,
-        filename=filename,
-        packaging='http://purl.org/net/sword-types/AOfr',
-        in_progress=False,
-    )
+    with get_pool().connection() as connection:
+        return connection.update(
+            edit_iri=edit_iri,
+            edit_media_iri=edit_media_iri,
+            payload=payload,
+            mimetype=mimetype,
+            filename=filename,
+            packaging='http://purl.org/net/sword-types/AOfr',
+            in_progress=False,
+        )
 
 
-class HttpLib2LayerIgnoreCert(HttpLib2Layer):
-    def __init__(self, cache_dir):
-        super(HttpLib2LayerIgnoreCert, self).__init__()
+@contextmanager
+def open_package(tei, fulltext):
+    """Zip a TEI with its full text, as deposited on HAL, while in the context.
+
+    The full text is copied into the zip in chunks as it is read, stored as
+    is since PDFs are already compressed. The zip is kept in memory up to
+    ``HAL_SWORD_SPOOL_MAX_BYTES`` and spooled to disk beyond, which is the
+    only copy of the full text: sword2 needs the length and the MD5 of a
+    payload before sending it, so the full text cannot be sent as it is
+    downloaded. The zip is removed when leaving the context.
+
+    Args:
+        tei(bytes): the record formatted in XML+TEI.
+        fulltext(file): a stream of the PDF of the full text.
+
+    Yields:
+        file: the zip, to be given to every attempt of :func:`create` or
+        :func:`update`.
+    """
+    package = SpooledTemporaryFile(max_size=current_app.config['HAL_SWORD_SPOOL_MAX_BYTES'])
+    try:
+        with ZipFile(package, mode='w', compression=ZIP_DEFLATED, allowZip64=True) as zf:
+            zf.writestr('meta.xml', tei)
+            _write_stream(zf, 'doc.pdf', fulltext)
+
+        yield package
+    finally:
+        package.close()
+
+
+class ConnectionPool(object):
+    """Pool of SWORD connections kept alive between uploads.
+
+    Each connection is used by one thread at a time, as neither
+    ``sword2.Connection`` nor ``httplib2.Http`` are thread-safe. Reusing
+    them saves the TCP and TLS handshakes.
+
+    Counts the HTTP connections opened and the SWORD requests sent, the
+    former being much lower than the latter when connections are reused.
+
+    Args:
+        factory(callable): returns a new ``sword2.Connection``.
+        size(int): maximum number of idle connections kept.
+        idle_timeout(float): seconds after which an idle connection is
+            closed instead of being reused.
+    """
+
+    def __init__(self, factory, size, idle_timeout):
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.requests = 0
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for a request.
+
+        Connections that failed for another reason than an HTTP error
+        response are closed, as they might be broken.
+        """
+        connection = self._acquire()
+        try:
+            yield connection
+        except HTTPResponseError:
+            self._release(connection)
+            raise
+        except Exception:
+            _close(connection)
+            raise
+        else:
+            self._release(connection)
+
+    def close(self):
+        """Close the idle connections."""
+        with self._lock:
+            while self._idle:
+                _close(self._idle.pop()[0])
+
+    def _acquire(self):
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return connection
+                _close(connection)
+
+        connection = self.factory()
+        connection.h.h.connections = _CountingDict(self._count_opened)
+        return connection
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.time()))
+                return
+
+        _close(connection)
+
+    def _count_opened(self):
+        with self._lock:
+            self.opened += 1
+
+    def __str__(self):
+        return 'SWORD connections: %d opened for %d requests' % (self.opened, self.requests)
+
+
+class _CountingDict(dict):
+    """The connections of an ``httplib2.Http``, counting those it opens."""
+
+    def __init__(self, on_new):
+        super(_CountingDict, self).__init__()
+        self.on_new = on_new
+
+    def __setitem__(self, key, value):
+        self.on_new()
+        super(_CountingDict, self).__setitem__(key, value)
+
+
+def _close(connection):
+    for http_connection in list(connection.h.h.connections.values()):
+        http_connection.close()
+    connection.h.h.connections.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the pool of connections to HAL of this process.
+
+    Its size and idle timeout are ``HAL_SWORD_POOL_SIZE`` and
+    ``HAL_SWORD_IDLE_TIMEOUT``.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                _new_pooled_connection,
+                size=current_app.config['HAL_SWORD_POOL_SIZE'],
+                idle_timeout=current_app.config['HAL_SWORD_IDLE_TIMEOUT'],
+            )
+
+    return _pool
+
+
+class StreamingHttpLib2Layer(HttpLib2Layer):
+    """HTTP layer sending file payloads as they are read.
+
+    ``HttpLib2Layer`` reads file payloads in memory, as httplib2 cannot send
+    a file again after an authentication challenge. The credentials are
+    sent with every request instead, so that there is no challenge and the
+    zip of a deposit with its full text is streamed from its spooled file.
+    Its ``Content-Length`` and ``Content-MD5`` are computed by sword2
+    beforehand, so it is not sent in chunks.
+
+    httplib2 sends a request again when its connection went stale, so file
+    payloads are rewound by the connections before every send.
+    """
+
+    def __init__(self, cache_dir=None, timeout=30.0, ca_certs=None,
+                 disable_ssl_certificate_validation=False):
         self.h = httplib2.Http(
-            cache_dir, timeout=30.0, ca_certs=None,
-            disable_ssl_certificate_validation=True)
+            cache_dir, timeout=timeout, ca_certs=ca_certs,
+            disable_ssl_certificate_validation=disable_ssl_certificate_validation)
+        self.authorization = None
+
+    def add_credentials(self, username, password):
+        super(StreamingHttpLib2Layer, self).add_credentials(username, password)
+        credentials = ('%s:%s' % (username, password)).encode('utf8')
+        self.authorization = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+    def request(self, uri, method, headers=None, payload=None):
+        headers = dict(headers or {})
+        if self.authorization:
+            headers['Authorization'] = self.authorization
+
+        resp, content = self.h.request(
+            uri, method, headers=headers, body=payload,
+            connection_type=_REWINDING_CONNECTIONS[urlparse(uri).scheme],
+        )
+        return HttpLib2Response(resp), content
+
+
+def _rewinding(connection_class):
+    """Return a subclass of an httplib2 connection class rewinding file
+    bodies before sending them."""
+
+    class RewindingConnection(connection_class):
+        def request(self, method, url, body=None, *args, **kwargs):
+            if hasattr(body, 'seek'):
+                body.seek(0)
+
+            return connection_class.request(self, method, url, body, *args, **kwargs)
+
+    return RewindingConnection
+
+
+_REWINDING_CONNECTIONS = {
+    'http': _rewinding(httplib2.HTTPConnectionWithTimeout),
+    'https': _rewinding(httplib2.HTTPSConnectionWithTimeout),
+}
 
 
-def _new_connection():
+class HttpLib2LayerIgnoreCert(StreamingHttpLib2Layer):
+    def __init__(self, cache_dir):
+        super(HttpLib2LayerIgnoreCert, self).__init__(
+            cache_dir, disable_ssl_certificate_validation=True)
+
+
+def _new_connection(**kwargs):
     user_name = current_app.config['HAL_USER_NAME']
     user_pass = current_app.config['HAL_USER_PASS']
 
+    cache = get_http_cache()
     if current_app.config['HAL_IGNORE_CERTIFICATES']:
-        http_impl = HttpLib2LayerIgnoreCert('.cache')
+        http_impl = HttpLib2LayerIgnoreCert(cache)
     else:
-        http_impl = HttpLib2Layer('.cache')
+        http_impl = StreamingHttpLib2Layer(cache)
 
     return Connection(
-        '', user_name=user_name, user_pass=user_pass, http_impl=http_impl)
+        '', user_name=user_name, user_pass=user_pass, http_impl=http_impl, **kwargs)
 
 
-def _create_payload(tei, doc_file):
-    if doc_file:
-        temp_file = TemporaryFile()
-        with ZipFile(temp_file, mode='w', compression=ZIP_DEFLATED) as zf:
-            zf.writestr('meta.xml', tei)
-            zf.write(doc_file, 'doc.pdf')
-        temp_file.seek(0)
+def _new_pooled_connection():
+    # Long-lived connections must not remember every request they sent.
+    return _new_connection(keep_history=False, cache_deposit_receipts=False)
+
+
+class CappedFileCache(httplib2.FileCache):
+    """httplib2 cache in a directory, removing the oldest responses beyond
+    a total size.
+
+    Args:
+        cache(str): the directory.
+        max_bytes(int): maximum total size of the cached responses.
+    """
+
+    def __init__(self, cache, max_bytes):
+        super(CappedFileCache, self).__init__(cache)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        super(CappedFileCache, self).set(key, value)
+        with self._lock:
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.cache):
+            path = os.path.join(self.cache, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
 
-        return temp_file, 'application/zip', 'meta.xml'
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
 
-    return tei, 'text/xml', 'meta.xml'
+
+class MemoryCache(LRUCache):
+    """httplib2 cache in memory, shared by the connections of a process."""
+
+    def __bool__(self):
+        # httplib2 skips caches that are false, which an empty one would be.
+        return True
+
+    __nonzero__ = __bool__
+
+
+_memory_cache = None
+
+
+def get_http_cache():
+    """Return the cache of the HTTP responses of HAL set in ``HAL_SWORD_HTTP_CACHE``.
+
+    Returns:
+        the cache to give to ``httplib2.Http``, ``None`` to disable it.
+    """
+    global _memory_cache
+
+    setting = current_app.config['HAL_SWORD_HTTP_CACHE']
+    if not setting:
+        return None
+
+    if setting == 'memory':
+        with _pool_lock:
+            if _memory_cache is None:
+                _memory_cache = MemoryCache(
+                    'HTTP responses', current_app.config['HAL_SWORD_HTTP_CACHE_SIZE'],
+                )
+        return _memory_cache
+
+    return CappedFileCache(setting, current_app.config['HAL_SWORD_HTTP_CACHE_MAX_BYTES'])
+
+
+def _get_payload(tei, package):
+    if package is None:
+        return tei, 'text/xml', 'meta.xml'
+
+    # The package is read again by every attempt.
+    package.seek(0)
+    return package, 'application/zip', 'meta.xml'
+
+
+# Entries can only be written in chunks from Python 3.6.
+_CHUNKED_ENTRIES = sys.version_info >= (3, 6)
+
+
+def _write_stream(zf, name, stream):
+    info = ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = ZIP_STORED
+
+    if _CHUNKED_ENTRIES:
+        with zf.open(info, mode='w', force_zip64=True) as entry:
+            shutil.copyfileobj(stream, entry)
+    else:
+        zf.writestr(info, stream.read())
@@ -24,26 +24,46 @@
 
 from __future__ import absolute_import, division, print_function
 
-from flask import render_template
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
-
 from inspire_schemas.readers import ConferenceReader, LiteratureReader
 from inspire_utils.record import get_value
 
+from .language import detect_language
+from .renderer import render, stream
 from ..utils import (
-    get_authors,
+    LazyAuthors,
     get_conference_record,
     get_divulgation,
     get_domains,
 )
 
+TEI_FIELDS = (
+    'abstracts',
+    'arxiv_eprints',
+    'authors',
+    'collaborations',
+    'control_number',
+    'document_type',
+    'dois',
+    'inspire_categories',
+    'keywords',
+    'languages',
+    'publication_info',
+    'publication_type',
+    'refereed',
+    'titles',
+)
+"""Fields of a Literature record read when converting it to TEI."""
+
 
-def convert_to_tei(record):
+def convert_to_tei(record, hal_id_map=None, conference_records=None):
     """Return the record formatted in XML+TEI per HAL's specification.
 
     Args:
         record(InspireRecord): a record.
+        hal_id_map(dict): the HAL identifiers of the institutions of the
+            record by recid, queried from the database when not given.
+        conference_records(dict): the Conference records of the record by
+            recid, queried from the database when not given.
 
     Returns:
         string: the record formatted in XML+TEI.
@@ -55,129 +75,154 @@ def convert_to_tei(record):
         ...
 
     """
-    if _is_comm(record):
-        ctx = _get_comm_context(record)
-        return render_template('hal/comm.xml', **ctx)
-    elif _is_art(record):
-        ctx = _get_art_context(record)
-        return render_template('hal/art.xml', **ctx)
-    elif _is_preprint(record):
-        ctx = _get_preprint_context(record)
-        return render_template('hal/preprint.xml', **ctx)
-
-    raise NotImplementedError
-
-
-def _is_comm(record):
-    document_types = LiteratureReader(record).document_types
-
-    return 'conference paper' in document_types
-
-
-def _get_comm_context(record):
-    lit_reader = LiteratureReader(record)
-    abstract = lit_reader.abstract
-    try:
-        abstract_language = detect(abstract)
-    except LangDetectException:
-        abstract_language = ''
-
-    conference_record = get_conference_record(record)
-    conference_title = get_value(conference_record, 'titles.title[0]')
-    conf_reader = ConferenceReader(conference_record)
-
-    return {
-        'abstract': abstract,
-        'abstract_language': abstract_language,
-        'arxiv_id': lit_reader.arxiv_id,
-        'authors': get_authors(record),
-        'collaborations': lit_reader.collaborations,
-        'conference_city': conf_reader.city,
-        'conference_country': conf_reader.country,
-        'conference_end_date': conf_reader.end_date,
-        'conference_start_date': conf_reader.start_date,
-        'conference_title': conference_title,
-        'divulgation': get_divulgation(record),
-        'doi': lit_reader.doi,
-        'domains': get_domains(record),
-        'inspire_id': lit_reader.inspire_id,
-        'journal_issue': lit_reader.journal_issue,
-        'journal_title': lit_reader.journal_title,
-        'journal_volume': lit_reader.journal_volume,
-        'keywords': lit_reader.keywords,
-        'language': lit_reader.language,
-        'page_artid': lit_reader.get_page_artid(),
-        'peer_reviewed': 1 if lit_reader.peer_reviewed else 0,
-        'publication_date': lit_reader.publication_date,
-        'subtitle': lit_reader.subtitle,
-        'title': lit_reader.title,
-    }
-
-
-def _is_art(record):
-    reader = LiteratureReader(record)
-    document_types = reader.document_types
-    published = reader.is_published
-
-    return 'article' in document_types and published
-
-
-def _get_art_context(record):
-    reader = LiteratureReader(record)
-
-    abstract = reader.abstract
-    try:
-        abstract_language = detect(abstract)
-    except LangDetectException:
-        abstract_language = ''
-
-    return {
-        'abstract': abstract,
-        'abstract_language': abstract_language,
-        'arxiv_id': reader.arxiv_id,
-        'authors': get_authors(record),
-        'collaborations': reader.collaborations,
-        'divulgation': get_divulgation(record),
-        'doi': reader.doi,
-        'domains': get_domains(record),
-        'inspire_id': reader.inspire_id,
-        'journal_issue': reader.journal_issue,
-        'journal_title': reader.journal_title,
-        'journal_volume': reader.journal_volume,
-        'keywords': reader.keywords,
-        'language': reader.language,
-        'page_artid': reader.get_page_artid(),
-        'peer_reviewed': 1 if reader.peer_reviewed else 0,
-        'publication_date': reader.publication_date,
-        'subtitle': reader.subtitle,
-        'title': reader.title,
-    }
-
-
-def _is_preprint(record):
-    document_types = LiteratureReader(record).document_types
-    return 'article' in document_types
-
-
-def _get_preprint_context(record):
-    reader = LiteratureReader(record)
-    abstract = reader.abstract
-    try:
-        abstract_language = detect(abstract)
-    except LangDetectException:
-        abstract_language = ''
-
-    return {
-        'abstract': abstract,
-        'abstract_language': abstract_language,
-        'arxiv_id': reader.arxiv_id,
-        'authors': get_authors(record),
-        'collaborations': reader.collaborations,
-        'divulgation': get_divulgation(record),
-        'domains': get_domains(record),
-        'inspire_id': reader.inspire_id,
-        'keywords': reader.keywords,
-        'language': reader.language,
-        'subtitle': reader.subtitle,
-        'title': reader.title,
-    }
+    document = TEIDocument(record, hal_id_map, conference_records)
+    if document.kind is None:
+        raise NotImplementedError
+
+    return render('hal/%s.xml' % document.kind, **document.get_context())
+
+
+def write_tei(record, fd, hal_id_map=None, conference_records=None):
+    """Write the record formatted in XML+TEI to a binary file, encoded in UTF-8.
+
+    Unlike :func:`convert_to_tei`, the TEI is written as it is generated,
+    which keeps the memory used by records with thousands of authors low.
+
+    Args:
+        record(InspireRecord): a record.
+        fd(file): the binary file written to.
+        hal_id_map(dict): as in :func:`convert_to_tei`.
+        conference_records(dict): as in :func:`convert_to_tei`.
+
+    Examples:
+        >>> with open('meta.xml', 'wb') as fd:
+        ...     write_tei(record, fd)
+
+    """
+    document = TEIDocument(record, hal_id_map, conference_records)
+    if document.kind is None:
+        raise NotImplementedError
+
+    stream('hal/%s.xml' % document.kind, fd, **document.get_context())
+
+
+_COMMON_FIELDS = (
+    'abstract',
+    'abstract_language',
+    'arxiv_id',
+    'authors',
+    'collaborations',
+    'divulgation',
+    'domains',
+    'inspire_id',
+    'keywords',
+    'language',
+    'subtitle',
+    'title',
+)
+
+_PUBLICATION_FIELDS = (
+    'doi',
+    'journal_issue',
+    'journal_title',
+    'journal_volume',
+    'page_artid',
+    'peer_reviewed',
+    'publication_date',
+)
+
+_CONFERENCE_FIELDS = (
+    'conference_city',
+    'conference_country',
+    'conference_end_date',
+    'conference_start_date',
+    'conference_title',
+)
+
+KIND_FIELDS = {
+    'art': _COMMON_FIELDS + _PUBLICATION_FIELDS,
+    'comm': _COMMON_FIELDS + _PUBLICATION_FIELDS + _CONFERENCE_FIELDS,
+    'preprint': _COMMON_FIELDS,
+}
+"""Fields rendered in the template of each kind of document."""
+
+
+class TEIDocument(object):
+    """What is rendered in TEI from a record, read in a single pass.
+
+    The kind of document is found first, then only the fields rendered for
+    that kind are read, each of them once. The kinds are, by priority:
+
+    * ``comm``: conference papers,
+    * ``art``: published articles,
+    * ``preprint``: the other articles,
+
+    and ``None`` for the records that cannot be pushed to HAL.
+
+    Args:
+        record(InspireRecord): a record.
+        hal_id_map(dict): passed to :class:`~inspire_hal.utils.LazyAuthors`.
+        conference_records(dict): passed to
+            :func:`~inspire_hal.utils.get_conference_record`.
+    """
+
+    __slots__ = ('kind',) + _COMMON_FIELDS + _PUBLICATION_FIELDS + _CONFERENCE_FIELDS
+
+    def __init__(self, record, hal_id_map=None, conference_records=None):
+        reader = LiteratureReader(record)
+
+        document_types = reader.document_types
+        if 'conference paper' in document_types:
+            self.kind = 'comm'
+        elif 'article' in document_types:
+            self.kind = 'art' if reader.is_published else 'preprint'
+        else:
+            self.kind = None
+            return
+
+        self.abstract = reader.abstract
+        self.abstract_language = detect_language(self.abstract, get_value(record, 'languages'))
+        self.arxiv_id = reader.arxiv_id
+        self.authors = LazyAuthors(record, hal_id_map)
+        self.collaborations = reader.collaborations
+        self.divulgation = get_divulgation(record)
+        self.domains = get_domains(record)
+        self.inspire_id = reader.inspire_id
+        self.keywords = reader.keywords
+        self.language = reader.language
+        self.subtitle = reader.subtitle
+        self.title = reader.title
+
+        if self.kind == 'preprint':
+            return
+
+        self.doi = reader.doi
+        self.journal_issue = reader.journal_issue
+        self.journal_title = reader.journal_title
+        self.journal_volume = reader.journal_volume
+        self.page_artid = reader.get_page_artid()
+        self.peer_reviewed = 1 if reader.peer_reviewed else 0
+        self.publication_date = reader.publication_date
+
+        if self.kind == 'art':
+            return
+
+        conference_record = get_conference_record(record, conference_records=conference_records)
+        conf_reader = ConferenceReader(conference_record)
+        self.conference_city = conf_reader.city
+        self.conference_country = conf_reader.country
+        self.conference_end_date = conf_reader.end_date
+        self.conference_start_date = conf_reader.start_date
+        self.conference_title = get_value(conference_record, 'titles.title[0]')
+
+    def get_context(self):
+        """Return the variables of the template of the document."""
+        return {field: getattr(self, field) for field in KIND_FIELDS[self.kind]}
+
+    def __getstate__(self):
+        fields = ('kind',) + KIND_FIELDS.get(self.kind, ())
+        return {field: getattr(self, field) for field in fields}
+
+    def __setstate__(self, state):
+        for field, value in state.items():
+            setattr(self, field, value)
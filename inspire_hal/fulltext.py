@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Full texts attached to the deposits."""
+
+from __future__ import absolute_import, division, print_function
+
+from contextlib import contextmanager
+
+import urllib3
+
+try:
+    from urllib.parse import urljoin, urlparse
+except ImportError:
+    from urlparse import urljoin, urlparse
+
+SCHEMES = ('http', 'https')
+"""Schemes of the URLs full texts are downloaded from.
+
+Documents are never read from the local disk, as any file could otherwise
+be published on HAL by setting the URL of a document to it.
+"""
+
+_http = None
+
+
+def get_fulltext_url(record, base_url=None):
+    """Return the URL of the full text of a record, if any.
+
+    Args:
+        record(InspireRecord): a record.
+        base_url(str): the URL relative URLs of documents are resolved
+            against.
+
+    Returns:
+        str: the URL of the first PDF document of the record that is a
+        full text and is not hidden, ``None`` if there is none.
+
+    Raises:
+        ValueError: if the URL of the document is not an ``http(s)`` URL.
+
+    Examples:
+        >>> record = {
+        ...     'documents': [
+        ...         {
+        ...             'fulltext': True,
+        ...             'key': 'fulltext.pdf',
+        ...             'url': '/api/files/0b9dd5d1/fulltext.pdf',
+        ...         },
+        ...     ],
+        ... }
+        >>> get_fulltext_url(record, 'https://inspirehep.net')
+        'https://inspirehep.net/api/files/0b9dd5d1/fulltext.pdf'
+
+    """
+    for document in record.get('documents', []):
+        if not document.get('fulltext') or document.get('hidden'):
+            continue
+        if not document.get('key', '').lower().endswith('.pdf'):
+            continue
+
+        url = document.get('url')
+        if url:
+            return _check_url(urljoin(base_url, url) if base_url else url)
+
+
+def _check_url(url):
+    if urlparse(url).scheme not in SCHEMES:
+        raise ValueError('Full text URL is not an http(s) URL: %s' % url)
+
+    return url
+
+
+@contextmanager
+def open_fulltext(url, timeout=60.0):
+    """Open the download of a full text, while in the context.
+
+    Nothing is read before the stream is, so that the full text can be
+    copied where it is needed as it is received, without holding it in
+    memory nor writing it to a temporary file.
+
+    Args:
+        url(str): the ``http(s)`` URL of the full text.
+        timeout(float): seconds to wait for the server.
+
+    Yields:
+        file: the stream of the full text.
+
+    Raises:
+        ValueError: if the URL is not an ``http(s)`` URL.
+        urllib3.exceptions.HTTPError: if the full text cannot be downloaded.
+    """
+    _check_url(url)
+
+    response = _get_http().request(
+        'GET', url, preload_content=False, timeout=timeout,
+    )
+    try:
+        if response.status != 200:
+            raise urllib3.exceptions.HTTPError(
+                'Error %d downloading %s' % (response.status, url)
+            )
+
+        yield response
+    finally:
+        response.release_conn()
+
+
+def _get_http():
+    global _http
+
+    if _http is None:
+        _http = urllib3.PoolManager(retries=urllib3.Retry(3, redirect=5))
+
+    return _http
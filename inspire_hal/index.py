@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""On-disk index of the HAL identifiers of the institutions.
+
+The index is a single file made of:
+
+* a header: the ``MAGIC`` bytes and the number of institutions,
+* their recids, sorted, as little-endian unsigned 32 bits integers,
+* one offset per institution and a final one, of the same type, delimiting
+  the HAL identifier of each institution in the string table,
+* the string table: the HAL identifiers encoded in UTF-8, empty for the
+  institutions without one.
+
+It is memory-mapped read-only, so that all the processes reading it share
+the same pages, and searched by bisection.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import mmap
+import os
+import struct
+
+from invenio_records.models import RecordMetadata
+
+MAGIC = b'HALINS1\0'
+"""Identifies the format of the index file."""
+
+DEFAULT_FILE = 'hal-institution-index.bin'
+"""Name of the index file in the instance path, unless set in ``HAL_INSTITUTION_INDEX_FILE``."""
+
+_HEADER = struct.Struct('<8sI')
+_UINT = struct.Struct('<I')
+
+_indexes = {}
+
+
+class InstitutionIndex(object):
+    """Read-only view of an index file.
+
+    Args:
+        path(str): the index file, as written by :func:`write_index`.
+
+    Raises:
+        ValueError: if the file is not an index, or is truncated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size < _HEADER.size:
+                raise ValueError('Not an institution index: %s' % path)
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError('Not an institution index: %s' % path)
+
+        self._recids = _HEADER.size
+        self._offsets = self._recids + _UINT.size * self._count
+        self._strings = self._offsets + _UINT.size * (self._count + 1)
+
+        if len(self._map) < self._strings or len(self._map) < self._strings + self._end():
+            self._map.close()
+            raise ValueError('Truncated institution index: %s' % path)
+
+    def get(self, recid, default=None):
+        """Return the HAL identifier of an institution.
+
+        Args:
+            recid(int): the recid of the institution.
+            default: returned if the institution is not in the index.
+
+        Returns:
+            str: the HAL identifier, or ``None`` if the institution has none.
+        """
+        position = self._find(recid)
+        if position is None:
+            return default
+
+        start, end = struct.unpack_from(
+            '<II', self._map, self._offsets + _UINT.size * position,
+        )
+        hal_id = self._map[self._strings + start:self._strings + end]
+
+        return hal_id.decode('utf8') or None
+
+    def close(self):
+        self._map.close()
+
+    def _find(self, recid):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._recid_at(middle) < recid:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._count and self._recid_at(low) == recid:
+            return low
+
+    def _end(self):
+        """Return the final offset, the size of the string table."""
+        return _UINT.unpack_from(self._map, self._offsets + _UINT.size * self._count)[0]
+
+    def _recid_at(self, position):
+        return _UINT.unpack_from(self._map, self._recids + _UINT.size * position)[0]
+
+    def __contains__(self, recid):
+        return self._find(recid) is not None
+
+    def __len__(self):
+        return self._count
+
+
+def write_index(path, institutions):
+    """Write an index file, replacing the previous one atomically.
+
+    Processes still reading the previous index keep their view of it.
+
+    Args:
+        path(str): the index file.
+        institutions(Iterable[Tuple[int, str]]): the recid of every
+            institution and its HAL identifier, ``None`` if it has none.
+
+    Returns:
+        int: the number of institutions in the index.
+    """
+    institutions = sorted(institutions)
+
+    hal_ids = [(hal_id or '').encode('utf8') for _, hal_id in institutions]
+    offsets = [0]
+    for hal_id in hal_ids:
+        offsets.append(offsets[-1] + len(hal_id))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as fd:
+        fd.write(_HEADER.pack(MAGIC, len(institutions)))
+        fd.write(struct.pack('<%dI' % len(institutions), *(recid for recid, _ in institutions)))
+        fd.write(struct.pack('<%dI' % len(offsets), *offsets))
+        fd.write(b''.join(hal_ids))
+    os.rename(temp_path, path)
+
+    return len(institutions)
+
+
+def build_index(path, yield_amt=1000):
+    """Write the index of all the institutions in the DB.
+
+    Args:
+        path(str): the index file.
+        yield_amt(int): number of institutions read at once.
+
+    Returns:
+        int: the number of institutions in the index.
+    """
+    # Imported here as the utils use the index.
+    from inspire_hal.utils import _get_hal_id
+
+    rows = RecordMetadata.query.with_entities(
+        RecordMetadata.json['control_number'].label('control_number'),
+        RecordMetadata.json['external_system_identifiers'].label('identifiers'),
+    ).filter(
+        RecordMetadata.json['_collections'].op('?')('Institutions'),
+    ).yield_per(yield_amt)
+
+    return write_index(path, (
+        (row.control_number, _get_hal_id({'external_system_identifiers': row.identifiers or []}))
+        for row in rows
+    ))
+
+
+def get_institution_index():
+    """Return the index set in ``HAL_INSTITUTION_INDEX_FILE``, if any.
+
+    The index is opened once per process. ``hal push`` sets the path to the
+    default one, in the instance path, when it is not configured.
+
+    Returns:
+        InstitutionIndex: the index, or ``None`` if it is not configured or
+        has not been built.
+    """
+    # Imported here as the utils use the index.
+    from inspire_hal.utils import get_config
+
+    path = get_config('HAL_INSTITUTION_INDEX_FILE')
+    if not path:
+        return None
+
+    if path not in _indexes:
+        _indexes[path] = InstitutionIndex(path) if os.path.exists(path) else None
+
+    return _indexes[path]
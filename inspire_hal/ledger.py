@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Ledger of the records uploaded to HAL."""
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import os
+import sqlite3
+from collections import namedtuple
+
+LedgerEntry = namedtuple('LedgerEntry', ['hal_id', 'fingerprint'])
+
+
+def get_fingerprint(tei):
+    """Return a fingerprint of a record formatted in XML+TEI.
+
+    Args:
+        tei(Union[str, bytes]): the record formatted in XML+TEI.
+
+    Returns:
+        str: the SHA-1 of the UTF-8 encoded TEI.
+    """
+    if not isinstance(tei, bytes):
+        tei = tei.encode('utf8')
+
+    return hashlib.sha1(tei).hexdigest()
+
+
+class Ledger(object):
+    """SQLite ledger of the last TEI successfully uploaded for each record.
+
+    Knowing what HAL already has allows a push to skip the records whose TEI
+    did not change, and to update the records created by a previous push
+    even before their HAL identifier reaches INSPIRE.
+
+    The underlying connection can only be used by the thread that opened
+    the ledger.
+
+    Args:
+        path(str): the SQLite database, created if missing.
+        commit_every(int): number of writes buffered before committing.
+    """
+
+    def __init__(self, path, commit_every=100):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.commit_every = commit_every
+        self._writes = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS uploads ('
+            'control_number INTEGER PRIMARY KEY, '
+            'hal_id TEXT NOT NULL, '
+            'fingerprint TEXT NOT NULL)'
+        )
+        self._db.commit()
+
+    def get(self, control_number):
+        """Return what was last uploaded for a record.
+
+        Returns:
+            LedgerEntry: the HAL identifier and the fingerprint of the TEI,
+            or ``None`` if the record was never uploaded.
+        """
+        row = self._db.execute(
+            'SELECT hal_id, fingerprint FROM uploads WHERE control_number = ?',
+            (control_number,),
+        ).fetchone()
+
+        return LedgerEntry(*row) if row else None
+
+    def set(self, control_number, hal_id, fingerprint, created=False):
+        """Remember a successful upload of a record.
+
+        The creation of a record is committed at once: if its HAL identifier
+        were lost, for instance because the push is killed, the next push
+        would create the record on HAL a second time.
+        """
+        self._db.execute(
+            'INSERT OR REPLACE INTO uploads (control_number, hal_id, fingerprint) '
+            'VALUES (?, ?, ?)',
+            (control_number, hal_id, fingerprint),
+        )
+
+        self._writes += 1
+        if created or self._writes % self.commit_every == 0:
+            self._db.commit()
+
+    def commit(self):
+        """Commit the uploads remembered so far."""
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
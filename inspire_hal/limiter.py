@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Limits of the load put on HAL by the uploads."""
+
+from __future__ import absolute_import, division, print_function
+
+import threading
+import time
+
+from inspire_hal.retry import classify
+
+OVERLOADED = frozenset(['throttled', 'server', 'timeout'])
+"""Kinds of failures, as returned by :func:`~inspire_hal.retry.classify`,
+telling that HAL is overloaded."""
+
+
+class TokenBucket(object):
+    """Limits the rate of the requests.
+
+    The bucket holds up to ``burst`` tokens and is refilled with ``rate``
+    tokens per second. Every request takes a token, waiting for it if the
+    bucket is empty. Tokens are reserved in the order requests arrive, so
+    that waiting requests are served in turn.
+
+    Args:
+        rate(float): requests per second.
+        burst(int): requests that can be sent at once after a pause.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.waited = 0.0
+        self._tokens = float(burst)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available."""
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+
+        if delay:
+            time.sleep(delay)
+
+
+class AdaptiveLimiter(object):
+    """Limits the number of requests in flight, adapting to the load of HAL.
+
+    The limit grows by one every time as many requests as the limit
+    succeed, and is multiplied by ``backoff`` when a request is throttled,
+    fails with a server error or a timeout, or takes more than
+    ``target_latency``. Requests sent before the last decrease do not
+    decrease it again, so that a burst of failures halves the limit only
+    once. Uploads thus settle at the largest concurrency HAL sustains.
+
+    Thread-safe, as it is shared by the upload workers.
+
+    Args:
+        minimum(int): minimum number of requests in flight, where it starts.
+        maximum(int): maximum number of requests in flight, usually the
+            number of upload workers.
+        target_latency(float): seconds above which a request is taken as a
+            sign of overload, ``None`` to only watch the failures.
+        backoff(float): factor applied to the limit on overload.
+        bucket(TokenBucket): limits the rate of the requests, if given.
+    """
+
+    def __init__(self, minimum=1, maximum=1, target_latency=None, backoff=0.5, bucket=None):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.bucket = bucket
+        self.limit = float(minimum)
+        self.peak = minimum
+        self.requests = 0
+        self.decreases = 0
+        self.seconds = 0.0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def call(self, func):
+        """Send a request once the limits allow it.
+
+        Args:
+            func(callable): sends the request, called without arguments.
+
+        Returns:
+            the result of ``func``.
+        """
+        start = self._acquire()
+        try:
+            result = func()
+        except Exception as e:
+            self._release(start, classify(e) in OVERLOADED)
+            raise
+
+        latency = time.time() - start
+        self._release(start, self.target_latency is not None and latency > self.target_latency)
+
+        return result
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+            self.peak = max(self.peak, self._in_flight)
+
+        if self.bucket:
+            self.bucket.acquire()
+
+        return time.time()
+
+    def _release(self, start, overloaded):
+        now = time.time()
+        with self._condition:
+            self._in_flight -= 1
+            self.requests += 1
+            self.seconds += now - start
+
+            if not overloaded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif start > self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+                self.decreases += 1
+
+            self._condition.notify_all()
+
+    def __str__(self):
+        summary = 'HAL requests: %d, up to %d in flight, limit decreased %d times' % (
+            self.requests, self.peak, self.decreases,
+        )
+        if self.requests:
+            summary += ', %.2fs on average' % (self.seconds / self.requests)
+        if self.bucket:
+            summary += ', %.1fs waited for the rate limit' % self.bucket.waited
+
+        return summary
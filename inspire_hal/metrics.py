@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Metrics of a push, exported in the Prometheus text format.
+
+The metrics are written to a file read by the textfile collector of the
+Prometheus node exporter, as a push is a batch job that cannot be scraped.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+"""Upper bounds, in seconds, of the buckets of the histograms."""
+
+
+class Counter(object):
+    """A value that only increases, optionally split by labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A value that can be set to anything."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(object):
+    """Distribution of durations, counted in cumulative buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[position] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the seconds spent in the context."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start)
+
+    def samples(self):
+        with self._lock:
+            samples = [
+                (self.name + '_bucket', {'le': _format_value(bound)}, count)
+                for bound, count in zip(self.buckets, self.counts)
+            ]
+            samples.append((self.name + '_sum', {}, self.sum))
+            samples.append((self.name + '_count', {}, self.count))
+
+        return samples
+
+    def __str__(self):
+        average = self.sum / self.count if self.count else 0.0
+        return '%d in %.1fs, %.3fs on average' % (self.count, self.sum, average)
+
+
+class Registry(object):
+    """The metrics of a push.
+
+    Args:
+        prefix(str): prepended to the names of all the metrics.
+
+    Examples:
+        >>> metrics = Registry('hal_push_')
+        >>> with metrics.histogram('upload_seconds', 'Uploads to HAL.').time():
+        ...     create(tei)
+        >>> metrics.write_textfile('/var/lib/node_exporter/hal_push.prom')
+
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name, help):
+        """Return the counter of that name, created if needed."""
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help):
+        """Return the gauge of that name, created if needed."""
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        """Return the histogram of that name, created if needed."""
+        return self._get(Histogram, name, help, buckets)
+
+    def _get(self, cls, name, help, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(self.prefix + name, help, *args)
+
+            return self._metrics[name]
+
+    def histograms(self):
+        return [metric for metric in self._metrics.values() if isinstance(metric, Histogram)]
+
+    def format(self, labels=None):
+        """Return the metrics in the Prometheus text format.
+
+        Args:
+            labels(dict): labels added to all the samples, such as the shard
+                of the push.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(u'# HELP %s %s' % (metric.name, metric.help))
+            lines.append(u'# TYPE %s %s' % (metric.name, metric.type))
+            for name, sample_labels, value in metric.samples():
+                sample_labels = dict(labels or {}, **sample_labels)
+                lines.append(u'%s%s %s' % (
+                    name, _format_labels(sample_labels), _format_value(value),
+                ))
+
+        return u'\n'.join(lines) + u'\n'
+
+    def write_textfile(self, path, labels=None):
+        """Write the metrics to a file, replacing it atomically so that the
+        node exporter never reads it half-written."""
+        temp_path = path + '.tmp'
+        with io.open(temp_path, 'w', encoding='utf8') as fd:
+            fd.write(self.format(labels))
+        os.rename(temp_path, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return u''
+
+    return u'{%s}' % u','.join(
+        u'%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in sorted(labels.items())
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return u'+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Log of the outcome of every record of the pushes.
+
+The log has one JSON object per line and per record pushed, such as::
+
+    {"control_number": 1, "action": "create", "hal_id": "hal-01", "seconds": 1.2,
+     "error": null, "message": null}
+
+``action`` is ``create``, ``update`` or ``skip``. ``error`` is the kind of
+failure, as given by :func:`inspire_hal.retry.classify`, or ``conversion``
+when the record could not be converted to TEI, and ``message`` its details.
+The records that failed can be pushed again with ``hal push --retry-failed``.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import os
+
+
+class OutcomeLog(object):
+    """Writes the outcome of records to a log.
+
+    Args:
+        path(str): the log, created if missing.
+        append(bool): whether to add to the log instead of replacing it, to
+            continue the log of a previous push.
+    """
+
+    def __init__(self, path, append=False):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self._fd = io.open(path, 'a' if append else 'w', encoding='utf8')
+
+    def write(self, control_number, action, hal_id=None, seconds=None, error=None,
+              message=None):
+        """Log the outcome of a record.
+
+        Args:
+            control_number(int): the control number of the record.
+            action(str): ``create``, ``update`` or ``skip``.
+            hal_id(str): its HAL identifier, if any.
+            seconds(float): the time its upload took, retries included.
+            error(str): the kind of failure, ``None`` if it succeeded.
+            message(str): the details of the failure.
+        """
+        line = json.dumps({
+            'control_number': control_number,
+            'action': action,
+            'hal_id': hal_id,
+            'seconds': round(seconds, 3) if seconds is not None else None,
+            'error': error,
+            'message': message,
+        }, sort_keys=True)
+        self._fd.write(u'%s\n' % line)
+
+    def close(self):
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_outcomes(path):
+    """Read a log of outcomes.
+
+    Args:
+        path(str): the log.
+
+    Yields:
+        dict: the outcome of each record, in the order they were written.
+    """
+    with io.open(path, encoding='utf8') as fd:
+        for line in fd:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_failed(path):
+    """Return the records whose last outcome in a log is a failure.
+
+    Records that succeeded after failing, for instance when the failures
+    were pushed again, are left out.
+
+    Args:
+        path(str): the log.
+
+    Returns:
+        List[int]: the control numbers of the records, sorted.
+    """
+    failed = {}
+    for outcome in read_outcomes(path):
+        failed[outcome['control_number']] = outcome['error'] is not None
+
+    return sorted(control_number for control_number, error in failed.items() if error)
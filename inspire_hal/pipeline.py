@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Stages of a push connected by bounded queues."""
+
+from __future__ import absolute_import, division, print_function
+
+import threading
+from collections import deque
+
+try:
+    from queue import Full, Queue
+except ImportError:
+    from Queue import Full, Queue
+
+_END = object()
+
+
+class _Failure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(app, produce, size):
+    """Iterate in a background thread, keeping a bounded number of items ahead.
+
+    The producer blocks once ``size`` items are waiting, so that a slow
+    consumer does not make the queue grow. Errors raised by the producer are
+    raised again by the iteration.
+
+    Args:
+        app(flask.Flask): the application, whose context is pushed in the
+            background thread.
+        produce(callable): returns the iterable to consume.
+        size(int): maximum number of items waiting to be consumed.
+
+    Yields:
+        the items of the iterable returned by ``produce``.
+    """
+    items = Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def _put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def _produce():
+        with app.app_context():
+            try:
+                for item in produce():
+                    if stopped.is_set():
+                        break
+                    _put(item)
+            except Exception as e:
+                _put(_Failure(e))
+            finally:
+                _put(_END)
+
+    producer = threading.Thread(target=_produce, name='hal-push-reader')
+    producer.daemon = True
+    producer.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def map_in_order(func, items, pool=None, window=1, key=None):
+    """Apply a function to items, possibly in a process pool, keeping their order.
+
+    At most ``window`` items are being processed at once, so the pool never
+    pulls more items than it can handle.
+
+    Args:
+        func(callable): the function to apply, which must be picklable when
+            a pool is used.
+        items(Iterable): the items.
+        pool(multiprocessing.pool.Pool): the pool running ``func``, or
+            ``None`` to run it in the calling thread.
+        window(int): maximum number of items in the pool.
+        key(callable): returns the argument passed to ``func`` for an item,
+            defaults to the item itself.
+
+    Yields:
+        Tuple: every item with the result of ``func`` for it.
+    """
+    key = key or (lambda item: item)
+
+    if pool is None:
+        for item in items:
+            yield item, func(key(item))
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.apply_async(func, (key(item),))))
+        if len(pending) >= window:
+            item, result = pending.popleft()
+            yield item, result.get()
+
+    while pending:
+        item, result = pending.popleft()
+        yield item, result.get()
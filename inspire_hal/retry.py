@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Retries of the requests to HAL that failed for a transient reason."""
+
+from __future__ import absolute_import, division, print_function
+
+import random
+import socket
+import threading
+import time
+
+import httplib2
+from sword2.exceptions import HTTPResponseError
+
+try:
+    from http.client import HTTPException
+except ImportError:
+    from httplib import HTTPException
+
+# socket.error is OSError on Python 3, which includes the errors of the
+# local files.
+try:
+    _CONNECTION_ERRORS = (ConnectionError, socket.timeout)
+except NameError:
+    _CONNECTION_ERRORS = (socket.error, socket.timeout)
+
+TRANSIENT_ERRORS = _CONNECTION_ERRORS + (HTTPException, httplib2.HttpLib2Error)
+"""Errors of the connection to HAL, which might not happen again."""
+
+
+def get_status(exception):
+    """Return the HTTP status of the response that caused an error, if any."""
+    if isinstance(exception, HTTPResponseError) and exception.response is not None:
+        try:
+            return int(exception.response['status'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+def classify(exception):
+    """Return the kind of a failure of a SWORD request.
+
+    Args:
+        exception(Exception): the error raised by the request.
+
+    Returns:
+        str: ``'throttled'`` for a 429 response, ``'server'`` for a 5xx
+        one, ``'timeout'`` for a 408 response or a timeout of the
+        connection, ``'connection'`` for other connection errors,
+        ``'client'`` for other error responses, which HAL gives when the
+        TEI is invalid, and ``'other'`` for anything else.
+
+    Examples:
+        >>> classify(ServerError({'status': 503}))
+        'server'
+
+    """
+    status = get_status(exception)
+    if status == 429:
+        return 'throttled'
+    if status == 408:
+        return 'timeout'
+    if status is not None and status >= 500:
+        return 'server'
+    if isinstance(exception, HTTPResponseError):
+        return 'client'
+    if isinstance(exception, socket.timeout):
+        return 'timeout'
+    if isinstance(exception, TRANSIENT_ERRORS):
+        return 'connection'
+
+    return 'other'
+
+
+RETRYABLE = frozenset(['throttled', 'server', 'timeout', 'connection'])
+"""Kinds of failures, as returned by :func:`classify`, worth retrying."""
+
+
+def is_retryable(exception):
+    """Return whether a failed SWORD request might succeed if sent again."""
+    return classify(exception) in RETRYABLE
+
+
+class RetryPolicy(object):
+    """Retries failed requests with an exponential backoff.
+
+    The delay before the n-th retry is drawn uniformly between 0 and
+    ``base_delay * 2 ** (n - 1)``, capped to ``max_delay``, so that the
+    workers that failed at the same time do not retry at the same time.
+    HAL asking to wait longer with a ``Retry-After`` header is obeyed.
+
+    A push has a budget of retries shared by all its uploads: once spent,
+    failures are not retried anymore, so that a push does not keep on
+    trying while HAL is down.
+
+    Thread-safe, so that all the upload workers share the same budget.
+
+    Args:
+        attempts(int): maximum number of attempts of a request.
+        base_delay(float): upper bound of the seconds before the first
+            retry, doubled at every retry. The delay is drawn between 0 and
+            it (full jitter), so it is half of it on average.
+        max_delay(float): maximum seconds between two attempts.
+        budget(int): maximum number of retries of the push, ``None`` for no
+            limit.
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=60.0, budget=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retries = {}
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def call(self, func, on_retry=None):
+        """Call a function until it succeeds or fails for good.
+
+        Args:
+            func(callable): sends the request, called without arguments.
+            on_retry(callable): called with the error and the delay before
+                each retry.
+
+        Returns:
+            the result of ``func``.
+
+        Raises:
+            Exception: the error of the last attempt.
+        """
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.attempts or not is_retryable(e) or not self._spend(e):
+                    raise
+
+                delay = self.get_delay(attempt, e)
+                if on_retry:
+                    on_retry(e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def get_delay(self, attempt, exception=None):
+        """Return the seconds to wait before retrying after an attempt."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+        retry_after = _get_retry_after(exception)
+        if retry_after is not None:
+            delay = max(delay, min(self.max_delay, retry_after))
+
+        return delay
+
+    @property
+    def total(self):
+        """Return the number of retries made."""
+        return sum(self.retries.values())
+
+    def _spend(self, exception):
+        with self._lock:
+            if self.budget is not None and self.total >= self.budget:
+                self.refused += 1
+                return False
+
+            kind = classify(exception)
+            self.retries[kind] = self.retries.get(kind, 0) + 1
+            return True
+
+    def __str__(self):
+        kinds = ', '.join('%s %s' % (count, kind) for kind, count in sorted(self.retries.items()))
+        summary = 'retries: %d (%s)' % (self.total, kinds or 'none')
+        if self.refused:
+            summary += ', %d refused as the budget was spent' % self.refused
+
+        return summary
+
+
+def _get_retry_after(exception):
+    if not isinstance(exception, HTTPResponseError) or exception.response is None:
+        return None
+
+    try:
+        return float(exception.response.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
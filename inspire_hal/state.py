@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""HAL push state kept between runs."""
+
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import json
+import os
+
+DATETIME_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d',
+)
+
+
+def parse_datetime(value):
+    """Parse a date as written by ``datetime.isoformat`` or typed by a user.
+
+    Args:
+        value(str): a date, optionally followed by a time.
+
+    Returns:
+        datetime.datetime: the parsed date.
+
+    Raises:
+        ValueError: if the date has none of the supported formats.
+
+    Examples:
+        >>> parse_datetime('2019-03-01')
+        datetime.datetime(2019, 3, 1, 0, 0)
+
+    """
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+
+    raise ValueError('Unsupported date: %s' % value)
+
+
+def load_watermark(path):
+    """Return the watermark saved by the last successful push.
+
+    Args:
+        path(str): the watermark file.
+
+    Returns:
+        datetime.datetime: the ``updated`` date up to which all records were
+        pushed, or ``None`` if no push has completed yet.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as fd:
+        return parse_datetime(json.load(fd)['updated'])
+
+
+def save_watermark(path, watermark):
+    """Save the watermark of a push, replacing the previous one atomically.
+
+    Args:
+        path(str): the watermark file.
+        watermark(datetime.datetime): the ``updated`` date up to which all
+            records were pushed.
+    """
+    _dump_atomically(path, {'updated': watermark.isoformat()})
+
+
+CHECKPOINT_DATES = ('since', 'started_at', 'last_updated', 'oldest_failed_updated')
+
+
+def load_checkpoint(path):
+    """Return the state of an interrupted push.
+
+    Args:
+        path(str): the checkpoint file.
+
+    Returns:
+        dict: the state saved by :func:`save_checkpoint`, or ``None`` if
+        there is no interrupted push.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as fd:
+        checkpoint = json.load(fd)
+
+    for key in CHECKPOINT_DATES:
+        if checkpoint.get(key):
+            checkpoint[key] = parse_datetime(checkpoint[key])
+
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Save the state of a running push, replacing the previous one atomically.
+
+    Args:
+        path(str): the checkpoint file.
+        checkpoint(dict): the state of the push. Its dates are stored in ISO
+            format and converted back by :func:`load_checkpoint`.
+    """
+    checkpoint = dict(checkpoint)
+    for key in CHECKPOINT_DATES:
+        if checkpoint.get(key):
+            checkpoint[key] = checkpoint[key].isoformat()
+
+    _dump_atomically(path, checkpoint)
+
+
+def clear_checkpoint(path):
+    """Remove the checkpoint of a push once it completed."""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _dump_atomically(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as fd:
+        json.dump(data, fd)
+    os.rename(temp_path, path)
@@ -24,46 +24,192 @@
 
 from __future__ import absolute_import, division, print_function
 
+import time
+
 import zulip
 
+from inspire_hal.archive import TEIArchive
 from inspire_hal.bulk_push import run
-
-
-def hal_push(limit, yield_amt):
-    """Run a hal push."""
+from inspire_hal.ledger import Ledger
+from inspire_hal.outcomes import OutcomeLog, get_failed
+from inspire_hal.state import save_watermark
+
+
+def hal_push(limit, yield_amt, workers=1, since=None, watermark_file=None,
+             ledger_file=None, force=False, checkpoint_file=None, resume=False,
+             converters=0, shard=None, metrics_file=None, outcome_log_file=None,
+             retry_failed=None):
+    """Run a hal push.
+
+    Args:
+        workers(int): number of concurrent uploads to HAL.
+        converters(int): number of processes converting records to TEI,
+            ``0`` to convert them in the main process.
+        since(datetime.datetime): only push the records modified after
+            this date.
+        watermark_file(str): where to save the date up to which all records
+            were pushed, to be used as ``since`` by the next run. Not saved
+            when ``limit`` is set, as only part of the records is pushed.
+        ledger_file(str): the ledger of the uploads, used to skip the records
+            whose TEI did not change since they were last uploaded.
+        force(bool): whether to upload the unchanged records anyway.
+        checkpoint_file(str): where to regularly save the progress of the
+            push, removed once it completes.
+        resume(bool): whether to continue the push saved in
+            ``checkpoint_file`` instead of starting a new one.
+        shard(Tuple[int, int]): the index of the slice of the records to
+            push, and the number of slices.
+        metrics_file(str): where to write the metrics of the push, in the
+            format of the textfile collector of the Prometheus node exporter.
+        outcome_log_file(str): where to log the outcome of every record.
+            Continued when resuming or retrying a push, replaced otherwise.
+        retry_failed(str): an outcome log, to only push the records whose
+            last outcome in it is a failure.
+    """
+    control_numbers = None
+    if retry_failed:
+        control_numbers = get_failed(retry_failed)
+        if not control_numbers:
+            print('HAL: No failed records in %s' % retry_failed)
+            return
+        print('HAL: Retrying the %s records that failed in %s' % (len(control_numbers), retry_failed))
 
     print('HAL: Starting to process HAL records')
     send_start_message()
 
-    total, now, ok, ko = run(
-        limit=limit,
-        yield_amt=yield_amt,
-    )
+    ledger = Ledger(ledger_file) if ledger_file else None
+    outcome_log = OutcomeLog(outcome_log_file, append=resume or bool(retry_failed)) \
+        if outcome_log_file else None
+    try:
+        result = run(
+            limit=limit,
+            yield_amt=yield_amt,
+            workers=workers,
+            since=since,
+            ledger=ledger,
+            force=force,
+            checkpoint_file=checkpoint_file,
+            resume=resume,
+            converters=converters,
+            shard=shard,
+            outcome_log=outcome_log,
+            control_numbers=control_numbers,
+        )
+    finally:
+        if ledger:
+            ledger.close()
+        if outcome_log:
+            outcome_log.close()
+
+    if watermark_file and result.watermark and not limit:
+        save_watermark(watermark_file, result.watermark)
+        print('HAL: Records modified after %s will be pushed next time' % result.watermark.isoformat())
+
+    if metrics_file:
+        result.metrics.write_textfile(metrics_file, {'shard': '%d/%d' % shard} if shard else None)
 
     print(
-        'HAL: Finished, %s records processed in %s: %s ok, %s ko'
-        % (total, now, ok, ko)
+        'HAL: Finished, %s records processed in %s: %s ok, %s ko, %s skipped'
+        % (result.total, result.now, result.ok, result.ko, result.skipped)
     )
+    for cache in result.caches:
+        print('HAL: %s' % cache)
+    print('HAL: %s' % result.connections)
+    print('HAL: %s' % result.retries)
+    print('HAL: %s' % result.limiter)
+    print(
+        'HAL: %.1fs spent converting records, of which %.1fs detecting languages'
+        % (result.timings['conversion'], result.timings['language detection'])
+    )
+    stages = result.metrics.histograms()
+    for stage in stages:
+        print('HAL: %s: %s' % (stage.name, stage))
     send_summary(
-        total=total,
-        ok=ok,
-        now=now,
-        ko=ko,
+        total=result.total,
+        ok=result.ok,
+        now=result.now,
+        ko=result.ko,
+        skipped=result.skipped,
+        caches=result.caches,
+        timings=result.timings,
+        connections=result.connections,
+        retries=result.retries,
+        limiter=result.limiter,
+        stages=stages,
+    )
+
+
+def hal_dry_run(limit, yield_amt, output, records_per_shard, since=None, converters=0,
+                shard=None):
+    """Run a hal push writing the TEI of the records to an archive.
+
+    Nothing is sent to HAL and no state of the pushes is changed, so that
+    the conversion of all the records can be profiled and its output
+    compared between releases.
+
+    Args:
+        output(str): the directory of the archive.
+        records_per_shard(int): number of records in every shard of the
+            archive.
+
+    The other arguments are those of :func:`hal_push`.
+    """
+    print('HAL: Starting a dry run, writing the TEI to %s' % output)
+
+    start = time.time()
+    with TEIArchive(output, records_per_shard) as archive:
+        result = run(
+            limit=limit,
+            yield_amt=yield_amt,
+            since=since,
+            converters=converters,
+            shard=shard,
+            archive=archive,
+        )
+    seconds = time.time() - start
+
+    print(
+        'HAL: Finished, %s records processed in %s: %s converted, %s failed'
+        % (result.total, result.now, result.ok, result.ko)
+    )
+    print('HAL: %s' % archive)
+    print('HAL: %.1f records/s' % (result.total / seconds if seconds else 0))
+    for cache in result.caches:
+        print('HAL: %s' % cache)
+    print(
+        'HAL: %.1fs spent converting records, of which %.1fs detecting languages'
+        % (result.timings['conversion'], result.timings['language detection'])
     )
 
+    return result
+
 
 def send_start_message():
     message = '''Hal push **started**! :rocket:'''
     send_to_zulip(message)
 
 
-def send_summary(total, ok, now, ko):
+def send_summary(total, ok, now, ko, skipped=0, caches=(), timings=None, connections=None,
+                 retries=None, limiter=None, stages=()):
     summary = '''Hal push has **finished**!
 
 Processed %s records in %s
 * %s succeded 
 * %s failed
-    ''' % (total, now, ok, ko)
+* %s skipped (unchanged since their last upload)
+    ''' % (total, now, ok, ko, skipped)
+    for cache in caches:
+        summary += '\n* %s' % cache
+    for step, seconds in sorted((timings or {}).items()):
+        summary += '\n* %.1fs spent in %s' % (seconds, step)
+    if connections:
+        summary += '\n* %s' % connections
+    if retries:
+        summary += '\n* %s' % retries
+    if limiter:
+        summary += '\n* %s' % limiter
+    for stage in stages:
+        summary += '\n* %s: %s' % (stage.name, stage)
     send_to_zulip(summary)
 
 
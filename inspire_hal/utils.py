@@ -24,9 +24,10 @@
 
 from __future__ import absolute_import, division, print_function
 
+from collections import namedtuple
 from itertools import chain
 
-from flask import current_app
+from flask import current_app, has_app_context
 from sqlalchemy import tuple_
 
 from inspire_dojson.utils import get_recid_from_ref
@@ -35,8 +36,36 @@ from inspire_utils.record import get_value
 from invenio_records.api import RecordMetadata
 from invenio_pidstore.models import PersistentIdentifier
 
+from inspire_hal import config
+from inspire_hal.cache import LRUCache
+from inspire_hal.index import get_institution_index
 
-def get_authors(record):
+try:
+    from sys import intern
+except ImportError:
+    # Unicode strings cannot be interned on Python 2.
+    def intern(value):
+        return value
+
+
+def get_config(name):
+    """Return a configuration variable, even outside of an application.
+
+    Args:
+        name(str): the variable.
+
+    Returns:
+        the value of the variable in the configuration of the current
+        application or, without one, its default value in
+        :mod:`inspire_hal.config`.
+    """
+    if has_app_context():
+        return current_app.config.get(name, getattr(config, name, None))
+
+    return getattr(config, name)
+
+
+def get_authors(record, hal_id_map=None):
     """Return the authors of a record.
 
     Queries the Institution records linked from the authors affiliations
@@ -45,9 +74,12 @@ def get_authors(record):
 
     Args:
         record(InspireRecord): a record.
+        hal_id_map(dict): the HAL identifiers of the institutions by recid,
+            as returned by :func:`get_linked_records`. Queried from the
+            database when not given.
 
     Returns:
-        list(dict): the authors of the record.
+        list(Author): the authors of the record.
 
     Examples:
         >>> record = {
@@ -62,35 +94,129 @@ def get_authors(record):
         ...     ],
         ... }
         >>> authors = get_authors(record)
-        >>> authors[0]['hal_id']
+        >>> authors[0].affiliations[0].hal_id
         '300037'
 
     """
-    hal_id_map = _get_hal_id_map(record)
+    return list(LazyAuthors(record, hal_id_map))
 
-    result = []
 
-    for author in record.get('authors', []):
-        affiliations = []
+class LazyAuthors(object):
+    """The authors of a record, formatted one by one when iterated over.
 
-        parsed_name = ParsedName.loads(author['full_name'])
-        first_name, last_name = parsed_name.first, parsed_name.last
+    Formatting the authors while the TEI is generated avoids holding all of
+    them at once, which matters for the thousands of authors of the large
+    collaborations.
 
-        for affiliation in author.get('affiliations', []):
-            recid = get_recid_from_ref(affiliation.get('record'))
-            if recid in hal_id_map and hal_id_map[recid]:
-                affiliations.append({'hal_id': hal_id_map[recid]})
+    Args:
+        record(InspireRecord): a record.
+        hal_id_map(dict): as in :func:`get_authors`.
+    """
 
-        result.append({
-            'affiliations': affiliations,
-            'first_name': first_name,
-            'last_name': last_name,
-        })
+    def __init__(self, record, hal_id_map=None):
+        if hal_id_map is None:
+            hal_id_map = _get_hal_id_map(record)
+
+        self.authors = record.get('authors', [])
+        self.hal_id_map = hal_id_map
+
+    def __iter__(self):
+        affiliations_by_hal_id = {}
+        for author in self.authors:
+            yield _format_author(author, self.hal_id_map, affiliations_by_hal_id)
+
+    def __len__(self):
+        return len(self.authors)
+
+
+Affiliation = namedtuple('Affiliation', ['hal_id'])
+"""An affiliation of an author, as rendered in TEI."""
+
+
+class Author(object):
+    """An author, as rendered in TEI.
+
+    Authors with the same name share the strings of their name, and authors
+    with the same affiliation share the affiliation, which keeps the
+    thousands of authors of the large collaborations small.
+    """
+
+    __slots__ = ('first_name', 'last_name', 'affiliations')
+
+    def __init__(self, first_name, last_name, affiliations=()):
+        self.first_name = first_name
+        self.last_name = last_name
+        self.affiliations = affiliations
+
+    def __eq__(self, other):
+        return isinstance(other, Author) and \
+            (self.first_name, self.last_name, self.affiliations) == \
+            (other.first_name, other.last_name, other.affiliations)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Author(%r, %r, %r)' % (self.first_name, self.last_name, self.affiliations)
+
+
+def parse_name(full_name):
+    """Return the first and last names of an author.
+
+    Names are parsed once per process, as the members of the large
+    collaborations sign thousands of records. The cache keeps
+    ``HAL_AUTHOR_NAME_CACHE_SIZE`` names, see :func:`get_name_cache`.
+
+    Args:
+        full_name(str): the full name of the author, as in the record.
+
+    Returns:
+        Tuple[str, str]: the first and last names.
+
+    Examples:
+        >>> parse_name(u'Smith, John')
+        (u'John', u'Smith')
+
+    """
+    cache = get_name_cache()
+    name = cache.get(full_name)
+    if name is None:
+        parsed_name = ParsedName.loads(full_name)
+        name = (intern(parsed_name.first), intern(parsed_name.last))
+        cache.set(full_name, name)
+
+    return name
+
+
+_name_cache = None
 
-    return result
 
+def get_name_cache():
+    """Return the cache of the parsed author names of this process."""
+    global _name_cache
 
-def get_conference_record(record, default=None):
+    if _name_cache is None:
+        _name_cache = LRUCache('author names', get_config('HAL_AUTHOR_NAME_CACHE_SIZE'))
+
+    return _name_cache
+
+
+def _format_author(author, hal_id_map, affiliations_by_hal_id):
+    first_name, last_name = parse_name(author['full_name'])
+
+    affiliations = []
+    for affiliation in author.get('affiliations', []):
+        recid = get_recid_from_ref(affiliation.get('record'))
+        hal_id = hal_id_map.get(recid)
+        if hal_id:
+            if hal_id not in affiliations_by_hal_id:
+                affiliations_by_hal_id[hal_id] = Affiliation(hal_id)
+            affiliations.append(affiliations_by_hal_id[hal_id])
+
+    return Author(first_name, last_name, tuple(affiliations))
+
+
+def get_conference_record(record, default=None, conference_records=None):
     """Return the first Conference record associated with a record.
 
     Queries the database to fetch the first Conference record referenced
@@ -99,10 +225,16 @@ def get_conference_record(record, default=None):
     Args:
         record(InspireRecord): a record.
         default: value to be returned if no conference record present/found
+        conference_records(dict): the Conference records by recid, as
+            returned by :func:`get_linked_records`. Queried from the
+            database when not given.
 
     Returns:
         InspireRecord: the first Conference record associated with the record.
 
+    Raises:
+        ValueError: if the Conference record does not exist.
+
     Examples:
         >>> record = {
         ...     'publication_info': [
@@ -118,12 +250,19 @@ def get_conference_record(record, default=None):
         972464
 
     """
-    pub_info = get_value(record, 'publication_info.conference_record[0]')
-    if not pub_info:
+    recid = _get_conference_recid(record)
+    if not recid:
         return default
 
-    conferences = get_db_records([('con', get_recid_from_ref(pub_info))])
-    return conferences[0]
+    if conference_records is not None:
+        conference_record = conference_records.get(recid)
+    else:
+        conference_record = next(iter(get_db_records([('con', recid)]) or []), None)
+
+    if conference_record is None:
+        raise ValueError('Conference record %s not found' % recid)
+
+    return conference_record
 
 
 def get_divulgation(record):
@@ -162,20 +301,118 @@ def get_domains(record):
 
     """
     terms = get_value(record, 'inspire_categories.term', default=[])
-    mapping = current_app.config['HAL_DOMAIN_MAPPING']
+    mapping = get_config('HAL_DOMAIN_MAPPING')
 
     return [mapping[term] for term in terms]
 
 
-def _get_hal_id_map(record):
+def get_linked_records(records, hal_ids=None, conferences=None):
+    """Return what is needed from the records linked from several records.
+
+    Fetches the Institution records linked from the authors affiliations
+    and the Conference records linked from the ``publication_info`` of all
+    the records at once, instead of issuing queries for every record.
+    Institutions found in the index set in ``HAL_INSTITUTION_INDEX_FILE``
+    are not queried.
+
+    Args:
+        records(List[InspireRecord]): the records.
+        hal_ids(inspire_hal.cache.LRUCache): the HAL identifiers of the
+            institutions already fetched, by recid. Only the missing ones
+            are queried, and then added to it.
+        conferences(inspire_hal.cache.LRUCache): the Conference records
+            already fetched, by recid, used in the same way.
+
+    Returns:
+        List[Tuple[dict, dict]]: for every record, the HAL identifiers of its
+        institutions by recid and its Conference records by recid, to be
+        passed to :func:`get_authors` and :func:`get_conference_record`.
+
+    """
+    institution_recids = set()
+    conference_recids = set()
+    for record in records:
+        institution_recids.update(_get_affiliation_recids(record))
+        conference_recids.add(_get_conference_recid(record))
+    conference_recids.discard(None)
+
+    hal_id_map = _get_indexed(institution_recids)
+    hal_id_map.update(_get_cached(hal_ids, institution_recids - set(hal_id_map)))
+    missing = [('ins', recid) for recid in institution_recids if recid not in hal_id_map]
+    institutions = get_db_records(missing) or []
+    for el in institutions:
+        hal_id_map[el['control_number']] = _get_hal_id(el)
+    if hal_ids is not None:
+        for _, recid in missing:
+            # Also remember the institutions that do not exist.
+            hal_ids.set(recid, hal_id_map.get(recid))
+
+    conference_records = _get_cached(conferences, conference_recids)
+    missing = [('con', recid) for recid in conference_recids if recid not in conference_records]
+    for el in get_db_records(missing) or []:
+        conference_records[el['control_number']] = el
+    if conferences is not None:
+        for _, recid in missing:
+            # Also remember the conferences that do not exist.
+            conferences.set(recid, conference_records.get(recid))
+
+    result = []
+    for record in records:
+        recids = _get_affiliation_recids(record)
+        conference_recid = _get_conference_recid(record)
+        result.append((
+            {recid: hal_id_map[recid] for recid in recids if hal_id_map.get(recid)},
+            {recid: conference_records[recid] for recid in [conference_recid] if conference_records.get(recid)},
+        ))
+
+    return result
+
+
+_MISSING = object()
+
+
+def _get_indexed(recids):
+    index = get_institution_index()
+    if index is None:
+        return {}
+
+    indexed = ((recid, index.get(recid, _MISSING)) for recid in recids)
+    return {recid: hal_id for recid, hal_id in indexed if hal_id is not _MISSING}
+
+
+def _get_cached(cache, keys):
+    if cache is None:
+        return {}
+
+    cached = ((key, cache.get(key, _MISSING)) for key in keys)
+    return {key: value for key, value in cached if value is not _MISSING}
+
+
+def _get_affiliation_recids(record):
     affiliations = get_value(record, 'authors.affiliations.record', default=[])
     affiliation_list = chain.from_iterable(affiliations)
-    affiliation_recids = [get_recid_from_ref(el) for el in affiliation_list]
+    recids = (get_recid_from_ref(el) for el in affiliation_list)
+
+    return set(recid for recid in recids if recid)
+
+
+def _get_conference_recid(record):
+    pub_info = get_value(record, 'publication_info.conference_record[0]')
+    if not pub_info:
+        return None
+
+    return get_recid_from_ref(pub_info)
+
+
+def _get_hal_id_map(record):
+    recids = _get_affiliation_recids(record)
+    hal_id_map = _get_indexed(recids)
 
-    pids = [('ins', pid) for pid in affiliation_recids]
-    institutions = get_db_records(pids)
+    pids = [('ins', pid) for pid in recids if pid not in hal_id_map]
+    institutions = get_db_records(pids) or []
+    hal_id_map.update((el['control_number'], _get_hal_id(el)) for el in institutions)
 
-    return {el['control_number']: _get_hal_id(el) for el in institutions}
+    return hal_id_map
 
 
 def _get_hal_id(record):
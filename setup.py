@@ -39,6 +39,7 @@ install_requires = [
     'celery~=4.0,>=4.1.0,<4.2.0',
     'Flask~=0.0,>=0.12.4',
     'Flask-CeleryExt~=0.0,>=0.3.1',
+    'futures~=3.0,>=3.2.0;python_version=="2.7"',
     'httplib2~=0.0,>=0.12.0',
     'inspire-dojson~=61.0,>=61.0.0',
     'inspire-schemas~=59.0,>=59.2.0',
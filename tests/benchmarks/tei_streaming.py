@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Compare rendering the TEI of a huge-collaboration paper to streaming it.
+
+The caches of the author names and of the languages are cleared before
+every conversion, as a push converts every record once.
+
+To be run with:
+$ python tests/benchmarks/tei_streaming.py [AUTHORS]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import sys
+import time
+
+from inspire_hal.core import language
+from inspire_hal.core.tei import convert_to_tei, write_tei
+from inspire_hal.utils import get_name_cache
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_record(authors):
+    return {
+        'authors': [
+            {
+                'full_name': u'Müller-%d, Jürgen' % i,
+                'affiliations': [
+                    {'record': {'$ref': 'http://localhost:5000/api/institutions/%d' % (i % 200)}},
+                ],
+            }
+            for i in range(authors)
+        ],
+        'collaborations': [{'value': 'ATLAS'}],
+        'control_number': 1,
+        'document_type': ['article'],
+        'titles': [{'title': u'Measurement of the tt̄ production cross-section'}],
+    }
+
+
+def render(record, hal_id_map):
+    return convert_to_tei(record, hal_id_map).encode('utf8')
+
+
+def stream(record, hal_id_map):
+    fd = io.BytesIO()
+    write_tei(record, fd, hal_id_map)
+    return fd.getvalue()
+
+
+def clear_caches():
+    get_name_cache().clear()
+    language._detected.clear()
+
+
+def measure(convert, record, hal_id_map, repeat=5):
+    seconds = 0.0
+    for _ in range(repeat):
+        clear_caches()
+        start = time.time()
+        tei = convert(record, hal_id_map)
+        seconds += time.time() - start
+    seconds /= repeat
+
+    # Tracing slows the conversion down, so it is measured separately.
+    peak = None
+    if tracemalloc:
+        clear_caches()
+        tracemalloc.start()
+        convert(record, hal_id_map)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return seconds, peak, len(tei)
+
+
+def main(authors=5000):
+    record = make_record(authors)
+    hal_id_map = {recid: str(300000 + recid) for recid in range(200)}
+
+    print('%d authors' % authors)
+    for name, convert in (('render + encode', render), ('stream', stream)):
+        seconds, peak, size = measure(convert, record, hal_id_map)
+        peak = '%.1f MiB' % (peak / 2 ** 20) if peak is not None else 'n/a'
+        print('%-16s %7.1f ms  peak %s  (%d bytes of TEI)' % (name, 1000 * seconds, peak, size))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
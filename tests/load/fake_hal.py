@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Local stand-in for the SWORD API of HAL.
+
+Accepts the deposits of ``hal push``, answering them like HAL does:
+
+* ``POST /sword/hal`` creates a record, answered with a ``201`` and a
+  deposit receipt giving its HAL identifier,
+* ``PUT /sword/<hal id>`` updates a record, answered with a ``200`` and a
+  deposit receipt,
+* failures are answered with SWORD error documents, as parsed by
+  :func:`inspire_hal.bulk_push.format_error`.
+
+The latency, the share of failures and the throttling of the server can be
+set, to see how a push behaves when HAL is slow or overloaded. As ``hal
+push`` reports to Zulip, the Zulip API is faked as well, under ``/api``.
+
+To be run with:
+$ python tests/load/fake_hal.py [--port 8080] [--latency 0.5] [--error-rate 0.01] ...
+
+then push to it with ``APP_HAL_COL_IRI=http://localhost:8080/sword/hal`` and
+``APP_HAL_EDIT_IRI=http://localhost:8080/sword/``.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+RECEIPT = u'''<?xml version="1.0" encoding="utf-8"?>
+<entry xmlns="http://www.w3.org/2005/Atom" xmlns:sword="http://purl.org/net/sword/terms/">
+  <title>Accepted media deposit to HAL</title>
+  <id>{hal_id}</id>
+  <updated>{updated}</updated>
+  <link rel="alternate" href="{base}/{hal_id}v{version}"/>
+  <link rel="edit" href="{base}/sword/{hal_id}"/>
+  <link rel="edit-media" href="{base}/sword/{hal_id}"/>
+  <sword:packaging>http://purl.org/net/sword-types/AOfr</sword:packaging>
+  <sword:treatment>stored</sword:treatment>
+</entry>
+'''
+
+ERROR = u'''<?xml version="1.0" encoding="utf-8"?>
+<sword:error xmlns="http://www.w3.org/2005/Atom" xmlns:sword="http://purl.org/net/sword/error/" href="http://purl.org/net/sword/error/{code}">
+  <title>ERROR</title>
+  <updated>{updated}</updated>
+  <sword:treatment>processing failed</sword:treatment>
+  <sword:verboseDescription>{description}</sword:verboseDescription>
+</sword:error>
+'''
+
+AOFR = 'http://purl.org/net/sword-types/AOfr'
+
+_EDIT_PATH = re.compile(r'^/sword/(?P<hal_id>hal-\d+)/?$')
+
+
+class Behaviour(object):
+    """How the fake HAL answers.
+
+    Args:
+        latency(float): average seconds taken by a deposit, drawn from an
+            exponential distribution.
+        error_rate(float): share of the deposits failing with a ``500``.
+        reject_rate(float): share of the deposits rejected with a ``400``,
+            as HAL does when the TEI is invalid.
+        rate_limit(float): deposits accepted per second, the others being
+            throttled with a ``429``. ``None`` for no limit.
+        max_concurrent(int): deposits processed at once, the others
+            failing with a ``503``. ``None`` for no limit.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, reject_rate=0.0, rate_limit=None,
+                 max_concurrent=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.rate_limit = rate_limit
+        self.max_concurrent = max_concurrent
+
+
+class FakeHAL(ThreadingMixIn, HTTPServer):
+    """The fake HAL server, counting the deposits and their outcome.
+
+    Args:
+        address(Tuple[str, int]): where to listen, port ``0`` for any free
+            port.
+        behaviour(Behaviour): how to answer.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), behaviour=None):
+        HTTPServer.__init__(self, address, _Handler)
+        self.behaviour = behaviour or Behaviour()
+        self.records = {}
+        self.statuses = {}
+        self.seconds = 0.0
+        self.messages = []
+        self._ids = itertools.count(1000000)
+        self._in_flight = 0
+        self._tokens = 1.0
+        self._refilled = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def start(self):
+        """Serve in a background thread."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def admit(self):
+        """Return the status of the error answering a deposit, if it fails
+        because of the load, ``None`` otherwise."""
+        behaviour = self.behaviour
+        with self._lock:
+            if behaviour.rate_limit:
+                now = time.time()
+                self._tokens = min(1.0, self._tokens + (now - self._refilled) * behaviour.rate_limit)
+                self._refilled = now
+                if self._tokens < 1:
+                    return 429
+                self._tokens -= 1
+
+            if behaviour.max_concurrent and self._in_flight >= behaviour.max_concurrent:
+                return 503
+            self._in_flight += 1
+
+    def done(self, status, seconds):
+        with self._lock:
+            self._in_flight -= 1
+        self.count(status, seconds)
+
+    def count(self, status, seconds=0.0):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.seconds += seconds
+
+    def new_hal_id(self):
+        return 'hal-%08d' % next(self._ids)
+
+    def __str__(self):
+        deposits = sum(self.statuses.values())
+        statuses = ', '.join('%d %s' % (count, status) for status, count in sorted(self.statuses.items()))
+        return 'fake HAL: %d deposits (%s), %d records, %.3fs per deposit on average' % (
+            deposits, statuses or 'none', len(self.records),
+            self.seconds / deposits if deposits else 0,
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        # The body is read in any case, so that the connection can be reused.
+        body = self._read_body()
+        if self.path.startswith('/api/'):
+            return self._zulip(body)
+        if self.path.rstrip('/') != '/sword/hal':
+            return self._error(404, 'No collection at %s' % self.path)
+
+        self._deposit(None, body)
+
+    def do_PUT(self):
+        body = self._read_body()
+        match = _EDIT_PATH.match(self.path)
+        if not match or match.group('hal_id') not in self.server.records:
+            return self._error(404, 'No record at %s' % self.path)
+
+        self._deposit(match.group('hal_id'), body)
+
+    def _deposit(self, hal_id, body):
+        start = time.time()
+        if not self.headers.get('Authorization'):
+            self.server.count(401)
+            return self._send(401, b'', {'WWW-Authenticate': 'Basic realm="SWORD"'})
+
+        status = self.server.admit()
+        if status:
+            self.server.count(status)
+            return self._error(status, 'Too many requests', {'Retry-After': '1'})
+
+        behaviour = self.server.behaviour
+        if behaviour.latency:
+            time.sleep(random.expovariate(1 / behaviour.latency))
+
+        draw = random.random()
+        if self.headers.get('Packaging') != AOFR:
+            status = self._error(415, 'Packaging %s is not supported' % self.headers.get('Packaging'))
+        elif not body:
+            status = self._error(400, 'The deposit is empty')
+        elif draw < behaviour.error_rate:
+            status = self._error(500, 'Internal server error')
+        elif draw < behaviour.error_rate + behaviour.reject_rate:
+            status = self._error(400, 'Invalid TEI: the title is missing')
+        else:
+            status = 201 if hal_id is None else 200
+            hal_id = hal_id or self.server.new_hal_id()
+            version = self.server.records.get(hal_id, 0) + 1
+            self.server.records[hal_id] = version
+            self._send(status, RECEIPT.format(
+                base=self.server.url, hal_id=hal_id, version=version, updated=_now(),
+            ).encode('utf8'), {
+                'Content-Type': 'application/atom+xml;type=entry',
+                'Location': '%s/sword/%s' % (self.server.url, hal_id),
+            })
+
+        self.server.done(status, time.time() - start)
+
+    def _zulip(self, body):
+        self.server.messages.append(body)
+        self._send(200, json.dumps({'result': 'success', 'msg': '', 'id': 1}).encode('utf8'), {
+            'Content-Type': 'application/json',
+        })
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _error(self, status, description, headers=None):
+        headers = dict(headers or {}, **{'Content-Type': 'text/xml'})
+        body = ERROR.format(code=status, updated=_now(), description=description)
+        self._send(status, body.encode('utf8'), headers)
+
+        return status
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Average seconds taken by a deposit.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of the deposits failing with a 500.')
+    parser.add_argument('--reject-rate', type=float, default=0.0,
+                        help='Share of the deposits rejected with a 400.')
+    parser.add_argument('--rate-limit', type=float,
+                        help='Deposits accepted per second, the others getting a 429.')
+    parser.add_argument('--max-concurrent', type=int,
+                        help='Deposits processed at once, the others getting a 503.')
+
+
+def get_behaviour(args):
+    return Behaviour(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        reject_rate=args.reject_rate,
+        rate_limit=args.rate_limit,
+        max_concurrent=args.max_concurrent,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeHAL(('127.0.0.1', args.port), get_behaviour(args))
+    print('Serving a fake HAL at %s/sword/hal' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Load test of ``hal push`` against a fake HAL.
+
+Fills the DB with synthetic records, then runs ``hal push`` in a separate
+process against the fake HAL of ``fake_hal.py`` and reports the records
+pushed per second, end to end, along with what the fake HAL received.
+
+The DB is reset as by the integration tests. To be run with the test DB
+of ``docker-compose.test.yaml`` running locally:
+$ python tests/load/harness.py --records 10000 --workers 8 --latency 0.2 --rate-limit 50
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
+from invenio_records.models import RecordMetadata
+
+from fake_hal import FakeHAL, add_arguments, get_behaviour
+from inspire_hal.factory import create_app
+
+ZULIPRC = '''[api]
+email=hal-push@example.org
+key=fake
+site={url}
+'''
+
+
+def make_record(control_number, authors):
+    return {
+        '_collections': ['Literature'],
+        '_export_to': {'HAL': True},
+        'arxiv_eprints': [{'value': '1901.%05d' % control_number, 'categories': ['hep-ex']}],
+        'authors': [{'full_name': u'Müller-%d, Jürgen' % i} for i in range(authors)],
+        'control_number': control_number,
+        'document_type': ['article'],
+        'inspire_categories': [{'term': 'Experiment-HEP'}],
+        'titles': [{'title': u'Load test record %d' % control_number}],
+    }
+
+
+def load_records(database_uri, count, authors):
+    app = create_app(SQLALCHEMY_DATABASE_URI=database_uri)
+    with app.app_context():
+        db.session.close()
+        db.drop_all()
+        db.create_all()
+
+        for control_number in range(1, count + 1):
+            metadata = RecordMetadata(json=make_record(control_number, authors))
+            db.session.add(metadata)
+            db.session.flush()
+            db.session.add(PersistentIdentifier(
+                pid_type='lit',
+                pid_value=str(control_number),
+                status='R',
+                object_type='rec',
+                object_uuid=metadata.id,
+            ))
+        db.session.commit()
+
+
+def push(args, fake_hal, state_dir):
+    """Run ``hal push`` against the fake HAL, returning its output."""
+    zuliprc = os.path.join(state_dir, 'zuliprc')
+    with open(zuliprc, 'w') as fd:
+        fd.write(ZULIPRC.format(url=fake_hal.url))
+
+    env = dict(
+        os.environ,
+        APP_HAL_COL_IRI=fake_hal.url + '/sword/hal',
+        APP_HAL_EDIT_IRI=fake_hal.url + '/sword/',
+        APP_HAL_USER_NAME='hal_user_name',
+        APP_HAL_USER_PASS='hal_user_pass',
+        APP_DB_INSPIRE_USER=args.db_user,
+        APP_DB_INSPIRE_PASSWORD=args.db_password,
+        APP_PROD_DB_HOST=args.db_host,
+        APP_DB_PORT=str(args.db_port),
+        APP_HAL_PUSH_LEDGER_FILE=os.path.join(state_dir, 'ledger.sqlite'),
+        APP_HAL_PUSH_CHECKPOINT_FILE=os.path.join(state_dir, 'checkpoint.json'),
+        APP_HAL_PUSH_WATERMARK_FILE=os.path.join(state_dir, 'watermark.json'),
+        APP_HAL_PUSH_OUTCOME_LOG_FILE=os.path.join(state_dir, 'outcomes.jsonl'),
+        APP_HAL_PUSH_METRICS_FILE=os.path.join(state_dir, 'hal_push.prom'),
+        ZULIP_CONFIG=zuliprc,
+    )
+    command = [
+        sys.executable, '-c', 'from inspire_hal import cli; cli()',
+        'hal', 'push', '--workers', str(args.workers), '--converters', str(args.converters),
+    ]
+
+    return subprocess.check_output(command, env=env, stderr=subprocess.STDOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000, help='Number of records to push.')
+    parser.add_argument('--authors', type=int, default=10, help='Number of authors per record.')
+    parser.add_argument('--workers', type=int, default=4, help='Workers of hal push.')
+    parser.add_argument('--converters', type=int, default=0, help='Converters of hal push.')
+    parser.add_argument('--db-host', default='localhost')
+    parser.add_argument('--db-port', type=int, default=5432)
+    parser.add_argument('--db-user', default='inspirehep')
+    parser.add_argument('--db-password', default='dbpass123')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    database_uri = 'postgresql+psycopg2://%s:%s@%s:%d/inspirehep' % (
+        args.db_user, args.db_password, args.db_host, args.db_port,
+    )
+    print('Loading %d records with %d authors' % (args.records, args.authors))
+    load_records(database_uri, args.records, args.authors)
+
+    fake_hal = FakeHAL(behaviour=get_behaviour(args)).start()
+    state_dir = tempfile.mkdtemp(prefix='hal-load-')
+    try:
+        start = time.time()
+        output = push(args, fake_hal, state_dir)
+        seconds = time.time() - start
+    finally:
+        fake_hal.stop()
+        shutil.rmtree(state_dir)
+
+    for line in output.decode('utf8').splitlines():
+        if line.startswith('HAL:'):
+            print(line)
+    print(fake_hal)
+    print('%d records pushed in %.1fs: %.1f records/s' % (
+        len(fake_hal.records), seconds, len(fake_hal.records) / seconds,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Check that the fake HAL answers the SWORD client like HAL does."""
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from flask import Flask
+
+from sword2.exceptions import HTTPResponseError, ServerError
+
+from fake_hal import Behaviour, FakeHAL
+from inspire_hal.bulk_push import format_error
+from inspire_hal.core.sword import create, get_pool, update
+
+
+@pytest.fixture
+def fake_hal():
+    server = FakeHAL(behaviour=Behaviour()).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def app(fake_hal):
+    app = Flask('fake_hal')
+    app.config.from_object('inspire_hal.config')
+    app.config.update(
+        HAL_COL_IRI=fake_hal.url + '/sword/hal',
+        HAL_EDIT_IRI=fake_hal.url + '/sword/',
+    )
+    with app.app_context():
+        yield app
+    get_pool().close()
+
+
+def test_create_then_update(app, fake_hal):
+    receipt = create(b'<TEI/>')
+    hal_id = receipt.id
+
+    update(b'<TEI/>', hal_id)
+
+    assert fake_hal.records == {hal_id: 2}
+    assert fake_hal.statuses == {200: 1, 201: 1}
+
+
+def test_rejected_deposits_are_parsed_by_format_error(app, fake_hal):
+    fake_hal.behaviour.reject_rate = 1.0
+
+    with pytest.raises(HTTPResponseError) as excinfo:
+        create(b'<TEI/>')
+
+    assert format_error(excinfo.value) == 'Invalid TEI: the title is missing'
+
+
+def test_failures(app, fake_hal):
+    fake_hal.behaviour.error_rate = 1.0
+
+    with pytest.raises(ServerError):
+        create(b'<TEI/>')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import gzip
+
+from inspire_hal.archive import IndexEntry, TEIArchive, read_index, read_tei
+
+
+def _tei(control_number):
+    return b'<TEI><idno>%d</idno></TEI>' % control_number
+
+
+def test_archive_is_split_in_shards(tmpdir):
+    with TEIArchive(str(tmpdir), records_per_shard=2) as archive:
+        for control_number in range(1, 6):
+            archive.add(control_number, _tei(control_number))
+
+    entries = list(read_index(str(tmpdir)))
+
+    assert archive.shards == 3
+    assert [entry.control_number for entry in entries] == [1, 2, 3, 4, 5]
+    assert [entry.shard for entry in entries] == [
+        'tei-00000.xml.gz', 'tei-00000.xml.gz', 'tei-00001.xml.gz', 'tei-00001.xml.gz',
+        'tei-00002.xml.gz',
+    ]
+    assert entries[1].offset == entries[0].length
+
+
+def test_read_tei_reads_a_single_record(tmpdir):
+    with TEIArchive(str(tmpdir)) as archive:
+        for control_number in range(1, 4):
+            archive.add(control_number, _tei(control_number))
+
+    entry = [entry for entry in read_index(str(tmpdir)) if entry.control_number == 2][0]
+
+    assert read_tei(str(tmpdir), entry) == _tei(2)
+
+
+def test_shards_are_plain_gzip_files(tmpdir):
+    with TEIArchive(str(tmpdir)) as archive:
+        archive.add(1, _tei(1))
+        archive.add(2, _tei(2))
+
+    with gzip.open(str(tmpdir.join('tei-00000.xml.gz'))) as fd:
+        assert fd.read() == _tei(1) + _tei(2)
+
+
+def test_archives_of_the_same_records_are_identical(tmpdir):
+    for name in ('first', 'second'):
+        with TEIArchive(str(tmpdir.join(name))) as archive:
+            archive.add(1, _tei(1))
+
+    assert tmpdir.join('first', 'tei-00000.xml.gz').read_binary() == \
+        tmpdir.join('second', 'tei-00000.xml.gz').read_binary()
+    assert list(read_index(str(tmpdir.join('first')))) == [
+        IndexEntry(1, 'tei-00000.xml.gz', 0, archive.compressed_bytes),
+    ]
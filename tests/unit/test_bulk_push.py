@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import datetime
+import socket
+import uuid
+from itertools import islice
+
+import pytest
+from flask import current_app
+from mock import MagicMock, Mock, patch
+
+from invenio_records.models import RecordMetadata
+from sword2.exceptions import HTTPResponseError, ServerError
+
+from inspire_hal.archive import TEIArchive, read_index, read_tei
+from inspire_hal.bulk_push import _Push, get_shard_bounds, run
+from inspire_hal.ledger import Ledger, get_fingerprint
+from inspire_hal.outcomes import OutcomeLog, get_failed, read_outcomes
+from inspire_hal.state import load_checkpoint
+
+
+def _updated(day):
+    return datetime.datetime(2019, 3, day)
+
+
+def _literature(control_number, hal_id=None):
+    record = {
+        '_collections': ['Literature'],
+        'control_number': control_number,
+    }
+    if hal_id:
+        record['external_system_identifiers'] = [{'schema': 'HAL', 'value': hal_id}]
+
+    return record
+
+
+def _raw_record(record):
+    control_number = record['control_number']
+    return Mock(
+        id=uuid.UUID(int=control_number),
+        json=record,
+        updated=_updated(control_number % 28 + 1),
+    )
+
+
+@pytest.fixture
+def candidates():
+    """Serve records in the pages requested by the push.
+
+    Filters are ignored, so the records must be given as the DB would
+    return them.
+    """
+    with patch.object(RecordMetadata, 'query') as query:
+        def _set(records, rows=None):
+            rows = iter(rows if rows is not None else [_raw_record(record) for record in records])
+            page = {}
+
+            def _limit(page_size):
+                page['size'] = page_size
+                return query
+
+            query.with_entities.return_value = query
+            query.filter.return_value = query
+            query.join.return_value = query
+            query.order_by.return_value = query
+            query.limit.side_effect = _limit
+            query.all.side_effect = lambda: list(islice(rows, page['size']))
+            return query
+        yield _set
+
+
+@pytest.fixture
+def sword():
+    with patch('inspire_hal.bulk_push.write_tei') as write_tei, \
+            patch('inspire_hal.bulk_push.get_linked_records') as get_linked_records, \
+            patch('inspire_hal.bulk_push.create') as create, \
+            patch('inspire_hal.bulk_push.update') as update, \
+            patch('inspire_hal.retry.time.sleep'):
+        get_linked_records.side_effect = lambda records, *caches: [({}, {}) for _ in records]
+        write_tei.side_effect = lambda record, fd, *args: fd.write(b'<TEI/>')
+        yield MagicMock(
+            write_tei=write_tei,
+            get_linked_records=get_linked_records,
+            create=create,
+            update=update,
+        )
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_run_counts_successes_and_failures(app, candidates, sword, workers):
+    candidates([_literature(i, hal_id='hal-%d' % i if i % 2 else None) for i in range(20)])
+    sword.update.side_effect = ServerError({'status': 503})
+
+    result = run(limit=0, yield_amt=100, workers=workers)
+
+    assert result.total == 20
+    assert result.ok == 10
+    assert result.ko == 10
+    assert sword.create.call_count == 10
+    assert sword.update.call_count == 30
+    assert result.retries.retries == {'server': 20}
+
+
+def test_run_converts_in_a_process_pool(app, candidates, sword):
+    candidates([_literature(i) for i in range(1, 11)] + [{'_collections': ['Institutions'], 'control_number': 11}])
+    sword.create.return_value = Mock(id='hal')
+
+    result = run(limit=0, yield_amt=3, workers=2, converters=2)
+
+    assert result.total == 11
+    assert result.ok == 10
+    assert sword.create.call_count == 10
+
+
+def test_run_ignores_fields_missing_from_the_projection(app, candidates, sword):
+    record = _literature(1)
+    record.update({'authors': None, 'external_system_identifiers': None})
+    candidates([record])
+    write_tei = sword.write_tei
+
+    with patch.dict(current_app.config, {'HAL_PUSH_PROJECTION': True}):
+        result = run(limit=0, yield_amt=100)
+
+    assert result.ok == 1
+    assert write_tei.call_args[0][0] == _literature(1)
+
+
+def test_run_reads_records_in_pages(app, candidates, sword):
+    query = candidates([_literature(i) for i in range(1, 8)])
+
+    result = run(limit=0, yield_amt=3)
+
+    assert result.total == 7
+    assert query.all.call_count == 3
+
+
+def test_run_fetches_linked_records_once_per_page(app, candidates, sword):
+    candidates([_literature(i) for i in range(1, 8)])
+    sword.get_linked_records.side_effect = lambda records, *caches: [
+        ({1: 'hal-inst'}, {}) for _ in records
+    ]
+
+    run(limit=0, yield_amt=3)
+
+    assert sword.get_linked_records.call_count == 3
+    assert sword.write_tei.call_args[0][2:] == ({1: 'hal-inst'}, {})
+
+
+def test_run_stops_reading_at_the_limit(app, candidates, sword):
+    query = candidates([_literature(i) for i in range(1, 8)])
+
+    result = run(limit=4, yield_amt=3)
+
+    assert result.total == 4
+    assert [args[0][0] for args in query.limit.call_args_list] == [3, 1]
+
+
+def test_run_retries_transient_failures(app, candidates, sword):
+    candidates([_literature(1)])
+    sword.create.side_effect = [socket.timeout(), Mock(id='hal-1')]
+
+    result = run(limit=0, yield_amt=100, workers=2)
+
+    assert result.ok == 1
+    assert result.ko == 0
+    assert result.retries.total == 1
+
+
+def test_run_does_not_retry_rejected_records(app, candidates, sword):
+    candidates([_literature(1)])
+    sword.create.side_effect = HTTPResponseError({'status': 400}, b'')
+
+    result = run(limit=0, yield_amt=100)
+
+    assert result.ko == 1
+    assert sword.create.call_count == 1
+
+
+def test_run_stops_retrying_once_the_budget_is_spent(app, candidates, sword):
+    candidates([_literature(i) for i in range(1, 6)])
+    sword.create.side_effect = ServerError({'status': 503})
+
+    with patch.dict(current_app.config, {'HAL_PUSH_RETRY_BUDGET': 2}):
+        result = run(limit=0, yield_amt=100)
+
+    assert result.ko == 5
+    assert sword.create.call_count == 7
+    assert result.retries.refused == 4
+
+
+def test_run_measures_the_stages_of_the_push(app, candidates, sword):
+    candidates([_literature(i) for i in range(1, 6)])
+    sword.create.side_effect = [socket.timeout()] + [Mock(id='hal')] * 5
+
+    result = run(limit=0, yield_amt=2)
+    metrics = result.metrics
+
+    assert metrics.histogram('db_fetch_seconds', '').count == 3
+    assert metrics.histogram('reference_resolution_seconds', '').count == 3
+    assert metrics.histogram('rendering_seconds', '').count == 5
+    assert metrics.histogram('upload_seconds', '').count == 6
+    assert metrics.histogram('retry_delay_seconds', '').count == 1
+    assert metrics.counter('retries_total', '').get(kind='timeout') == 1
+    assert metrics.counter('records_total', '').get(outcome='ok') == 5
+
+
+def test_run_logs_the_outcome_of_every_record(app, candidates, sword, ledger, tmpdir):
+    path = str(tmpdir.join('outcomes.jsonl'))
+    candidates([_literature(1), _literature(2, hal_id='hal-2'), _literature(3)])
+    sword.create.side_effect = [Mock(id='hal-1'), HTTPResponseError({'status': 400}, b'')]
+    ledger.set(2, 'hal-2', get_fingerprint(b'<TEI/>'))
+
+    with OutcomeLog(path) as outcome_log:
+        run(limit=0, yield_amt=100, ledger=ledger, outcome_log=outcome_log)
+
+    outcomes = sorted(read_outcomes(path), key=lambda outcome: outcome['control_number'])
+
+    assert [(outcome['action'], outcome['hal_id'], outcome['error']) for outcome in outcomes] == [
+        ('create', 'hal-1', None),
+        ('skip', 'hal-2', None),
+        ('create', None, 'client'),
+    ]
+    assert outcomes[0]['seconds'] >= 0
+    assert get_failed(path) == [3]
+
+
+def test_run_logs_network_failures(app, candidates, sword, tmpdir):
+    path = str(tmpdir.join('outcomes.jsonl'))
+    candidates([_literature(1), _literature(2)])
+    sword.create.side_effect = socket.timeout()
+
+    with OutcomeLog(path) as outcome_log:
+        result = run(limit=0, yield_amt=100, outcome_log=outcome_log)
+
+    outcomes = list(read_outcomes(path))
+
+    assert result.ko == 2
+    assert [outcome['error'] for outcome in outcomes] == ['timeout', 'timeout']
+    assert outcomes[0]['message'] == socket.timeout.__name__
+
+
+def test_run_only_reads_the_given_control_numbers(app, candidates, sword):
+    query = candidates([_literature(3)])
+    sword.create.return_value = Mock(id='hal-3')
+
+    result = run(limit=0, yield_amt=100, control_numbers=[3])
+
+    assert result.ok == 1
+    assert query.join.called
+
+
+def test_run_attaches_the_full_text(app, candidates, sword):
+    record = _literature(1)
+    record['documents'] = [{'fulltext': True, 'key': 'article.pdf', 'url': '/files/article.pdf'}]
+    candidates([record])
+
+    with patch.dict(current_app.config, {'HAL_PUSH_FULLTEXT': True}), \
+            patch('inspire_hal.bulk_push.open_fulltext') as open_fulltext, \
+            patch('inspire_hal.bulk_push.open_package') as open_package:
+        open_fulltext.return_value.__enter__.return_value = 'fulltext'
+        open_package.return_value.__enter__.return_value = 'package'
+        result = run(limit=0, yield_amt=100)
+
+    assert result.ok == 1
+    open_fulltext.assert_called_once_with('https://inspirehep.net/files/article.pdf')
+    open_package.assert_called_once_with(b'<TEI/>', 'fulltext')
+    sword.create.assert_called_once_with(b'<TEI/>', 'package')
+
+
+def test_run_pushes_records_without_full_texts_at_local_files(app, candidates, sword):
+    record = _literature(1)
+    record['documents'] = [{'fulltext': True, 'key': 'article.pdf', 'url': 'file:///etc/passwd'}]
+    candidates([record])
+
+    with patch.dict(current_app.config, {'HAL_PUSH_FULLTEXT': True}), \
+            patch('inspire_hal.bulk_push.open_fulltext') as open_fulltext:
+        result = run(limit=0, yield_amt=100)
+
+    assert result.ok == 1
+    assert not open_fulltext.called
+    sword.create.assert_called_once_with(b'<TEI/>', None)
+
+
+def test_run_writes_the_tei_to_an_archive_without_uploading(app, candidates, sword, tmpdir):
+    candidates([_literature(i) for i in range(1, 4)])
+
+    with TEIArchive(str(tmpdir)) as archive:
+        result = run(limit=0, yield_amt=100, archive=archive)
+
+    entries = list(read_index(str(tmpdir)))
+
+    assert result.ok == 3
+    assert [entry.control_number for entry in entries] == [1, 2, 3]
+    assert read_tei(str(tmpdir), entries[0]) == b'<TEI/>'
+    assert not sword.create.called
+
+
+def test_run_watermark_is_the_last_updated_record(app, candidates, sword):
+    candidates([_literature(i) for i in range(1, 6)])
+
+    result = run(limit=0, yield_amt=100)
+
+    assert result.watermark == _updated(6)
+
+
+def test_run_watermark_stays_before_failed_uploads(app, candidates, sword):
+    candidates([_literature(i, hal_id='hal-%d' % i if i == 3 else None) for i in range(1, 6)])
+    sword.update.side_effect = Exception('HAL is down')
+
+    result = run(limit=0, yield_amt=100)
+
+    assert result.ko == 1
+    assert result.watermark < _updated(4)
+    assert result.watermark > _updated(3)
+
+
+def test_run_watermark_is_unchanged_without_records(app, candidates, sword):
+    candidates([])
+
+    result = run(limit=0, yield_amt=100, since=_updated(1))
+
+    assert result.watermark == _updated(1)
+
+
+@pytest.fixture
+def ledger(tmpdir):
+    with Ledger(str(tmpdir.join('ledger.sqlite'))) as ledger:
+        yield ledger
+
+
+def test_run_skips_records_whose_tei_did_not_change(app, candidates, sword, ledger):
+    candidates([_literature(1, hal_id='hal-1'), _literature(2, hal_id='hal-2')])
+    ledger.set(1, 'hal-1', get_fingerprint(u'<TEI/>'))
+    ledger.set(2, 'hal-2', get_fingerprint(u'<TEI>old</TEI>'))
+
+    result = run(limit=0, yield_amt=100, ledger=ledger)
+
+    assert result.ok == 1
+    assert result.skipped == 1
+    assert sword.update.call_count == 1
+    assert ledger.get(2).fingerprint == get_fingerprint(u'<TEI/>')
+
+
+def test_run_force_uploads_unchanged_records(app, candidates, sword, ledger):
+    candidates([_literature(1, hal_id='hal-1')])
+    ledger.set(1, 'hal-1', get_fingerprint(u'<TEI/>'))
+
+    result = run(limit=0, yield_amt=100, ledger=ledger, force=True)
+
+    assert result.ok == 1
+    assert result.skipped == 0
+
+
+def test_run_updates_records_created_by_a_previous_push(app, candidates, sword, ledger):
+    candidates([_literature(1)])
+    ledger.set(1, 'hal-1', get_fingerprint(u'<TEI>old</TEI>'))
+
+    run(limit=0, yield_amt=100, ledger=ledger)
+
+    assert sword.create.call_count == 0
+    assert sword.update.call_args[0][1] == b'hal-1'
+
+
+def test_run_records_created_records_in_the_ledger(app, candidates, sword, ledger):
+    candidates([_literature(1)])
+    sword.create.return_value = Mock(id='hal-1')
+
+    run(limit=0, yield_amt=100, ledger=ledger)
+
+    assert ledger.get(1) == ('hal-1', get_fingerprint(u'<TEI/>'))
+
+
+def _interrupted(records, after):
+    for i, record in enumerate(records):
+        if i == after:
+            raise RuntimeError('lost connection to the DB')
+        yield _raw_record(record)
+
+
+def test_run_resumes_an_interrupted_push(app, candidates, sword, tmpdir):
+    records = [_literature(i, hal_id='hal-%d' % i) for i in range(1, 8)]
+    checkpoint_file = str(tmpdir.join('checkpoint.json'))
+    candidates(records, rows=_interrupted(records, after=6))
+
+    with patch.dict(current_app.config, {'HAL_PUSH_CHECKPOINT_EVERY': 2}):
+        with pytest.raises(RuntimeError):
+            run(limit=0, yield_amt=2, workers=2, checkpoint_file=checkpoint_file)
+
+        assert sword.update.call_count == 6
+        checkpoint = load_checkpoint(checkpoint_file)
+        assert checkpoint['last_id'] == str(uuid.UUID(int=6))
+
+        candidates(records[6:])
+        result = run(
+            limit=0,
+            yield_amt=2,
+            workers=2,
+            checkpoint_file=checkpoint_file,
+            resume=True,
+        )
+
+    assert sword.update.call_count == 7
+    assert result.total == 7
+    assert result.ok == 7
+    assert not tmpdir.join('checkpoint.json').check()
+
+
+def test_run_resume_without_checkpoint_starts_a_new_push(app, candidates, sword, tmpdir):
+    candidates([_literature(1, hal_id='hal-1')])
+
+    result = run(
+        limit=0,
+        yield_amt=100,
+        checkpoint_file=str(tmpdir.join('checkpoint.json')),
+        resume=True,
+    )
+
+    assert result.ok == 1
+
+
+def test_get_shard_bounds_cover_all_ids():
+    bounds = [get_shard_bounds(index, 3) for index in range(3)]
+
+    assert bounds[0][0] == uuid.UUID(int=0)
+    assert bounds[0][1] == bounds[1][0]
+    assert bounds[1][1] == bounds[2][0]
+    assert bounds[2][1] is None
+
+
+def test_checkpoint_keeps_records_done_out_of_order(app, tmpdir):
+    checkpoint_file = str(tmpdir.join('checkpoint.json'))
+    push = _Push(current_app._get_current_object(), 1, checkpoint_file=checkpoint_file)
+    push.total = 3
+    for record_id in 'abc':
+        push._outcomes[record_id] = None
+
+    push._finish('b', 'ok')
+    push.save_checkpoint()
+    checkpoint = load_checkpoint(checkpoint_file)
+
+    assert checkpoint['last_id'] is None
+    assert checkpoint['total'] == 0
+    assert checkpoint['done'] == {'b': 'ok'}
+
+    push._finish('a', 'ko')
+    push.save_checkpoint()
+    checkpoint = load_checkpoint(checkpoint_file)
+
+    assert checkpoint['last_id'] == 'b'
+    assert checkpoint['total'] == 2
+    assert checkpoint['done'] == {}
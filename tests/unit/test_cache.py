@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from inspire_hal.cache import LRUCache
+
+
+def test_lru_cache_drops_the_least_recently_used_entry():
+    cache = LRUCache('institutions', maxsize=2)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+
+    assert len(cache) == 2
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a'
+    assert cache.get(3) == 'c'
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache('institutions', maxsize=2)
+    cache.set(1, None)
+
+    assert cache.get(1, 'missing') is None
+    assert cache.get(2, 'missing') == 'missing'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert str(cache) == 'institutions cache: 1 hits, 1 misses (50.0% hits)'
+
+
+def test_lru_cache_clear_keeps_the_statistics():
+    cache = LRUCache('institutions', maxsize=2)
+    cache.set(1, 'a')
+    cache.get(1)
+
+    cache.clear()
+
+    assert cache.get(1) is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
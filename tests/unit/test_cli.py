@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from click.testing import CliRunner
+from flask import current_app
+from flask.cli import ScriptInfo
+from mock import patch
+
+from inspire_hal.cli import get_state_file, parse_shard, push
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+
+
+@pytest.mark.parametrize('value', ['4/4', '-1/4', '1', 'a/b'])
+def test_parse_shard_rejects_invalid_shards(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_get_state_file_is_separate_for_every_shard(app):
+    with patch.dict(current_app.config, {'HAL_PUSH_LEDGER_FILE': '/data/ledger.sqlite'}):
+        assert get_state_file('HAL_PUSH_LEDGER_FILE', 'unused') == '/data/ledger.sqlite'
+        assert get_state_file('HAL_PUSH_LEDGER_FILE', 'unused', (1, 4)) == '/data/ledger.sqlite.shard-1-of-4'
+
+
+def _invoke_push(args):
+    app = current_app._get_current_object()
+    script_info = ScriptInfo(create_app=lambda *args: app)
+    return CliRunner().invoke(push, args, obj=script_info)
+
+
+@pytest.mark.parametrize('option', ['--resume', '--force'])
+def test_push_dry_run_rejects_options_of_real_pushes(app, tmpdir, option):
+    result = _invoke_push(['--dry-run', '--output', str(tmpdir), option])
+
+    assert result.exit_code == 2
+    assert '--dry-run cannot be combined' in result.output
+
+
+def test_push_dry_run_rejects_a_non_empty_output(app, tmpdir):
+    tmpdir.join('tei-00000.xml.gz').write_binary(b'')
+
+    result = _invoke_push(['--dry-run', '--output', str(tmpdir)])
+
+    assert result.exit_code == 2
+    assert '--output must be a new or empty directory' in result.output
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import io
+from zipfile import ZIP_STORED, ZipFile
+
+import httplib2
+import pytest
+from flask import current_app
+from mock import Mock, patch
+
+from sword2.exceptions import ServerError
+
+from inspire_hal.core.sword import (
+    CappedFileCache,
+    ConnectionPool,
+    MemoryCache,
+    StreamingHttpLib2Layer,
+    _REWINDING_CONNECTIONS,
+    create,
+    get_http_cache,
+    open_package,
+)
+
+
+def _new_connection():
+    connection = Mock()
+    connection.h.h.connections = {}
+    return connection
+
+
+def _send(pool):
+    with pool.connection() as connection:
+        if not connection.h.h.connections:
+            connection.h.h.connections['https:hal'] = Mock()
+        return connection
+
+
+def test_pool_reuses_connections():
+    pool = ConnectionPool(_new_connection, size=2, idle_timeout=30)
+
+    first = _send(pool)
+    second = _send(pool)
+
+    assert first is second
+    assert (pool.opened, pool.requests) == (1, 2)
+    assert str(pool) == 'SWORD connections: 1 opened for 2 requests'
+
+
+def test_pool_closes_idle_connections():
+    pool = ConnectionPool(_new_connection, size=2, idle_timeout=30)
+    first = _send(pool)
+
+    with patch('inspire_hal.core.sword.time.time', return_value=1e12):
+        second = _send(pool)
+
+    assert first is not second
+    assert pool.opened == 2
+
+
+def test_pool_keeps_at_most_size_idle_connections():
+    pool = ConnectionPool(_new_connection, size=1, idle_timeout=30)
+
+    with pool.connection() as first, pool.connection() as second:
+        assert first is not second
+
+    assert len(pool._idle) == 1
+
+
+def test_pool_keeps_connections_after_an_error_response():
+    pool = ConnectionPool(_new_connection, size=2, idle_timeout=30)
+
+    with pytest.raises(ServerError):
+        with pool.connection():
+            raise ServerError(Mock(status=503), '')
+
+    assert len(pool._idle) == 1
+
+
+def test_pool_drops_broken_connections():
+    pool = ConnectionPool(_new_connection, size=2, idle_timeout=30)
+
+    with pytest.raises(IOError):
+        with pool.connection():
+            raise IOError('Connection reset by peer')
+
+    assert len(pool._idle) == 0
+
+
+@pytest.mark.parametrize('setting,cache_type', [
+    (None, type(None)),
+    ('memory', MemoryCache),
+])
+def test_get_http_cache(app, setting, cache_type):
+    with patch.dict(current_app.config, {'HAL_SWORD_HTTP_CACHE': setting}):
+        assert isinstance(get_http_cache(), cache_type)
+
+
+def test_memory_cache_is_used_by_httplib2_even_when_empty():
+    assert MemoryCache('HTTP responses', maxsize=1)
+
+
+def test_get_http_cache_in_a_directory(app, tmpdir):
+    with patch.dict(current_app.config, {'HAL_SWORD_HTTP_CACHE': str(tmpdir)}):
+        cache = get_http_cache()
+
+    assert isinstance(cache, CappedFileCache)
+    assert cache.cache == str(tmpdir)
+
+
+def test_capped_file_cache_removes_the_oldest_responses(tmpdir):
+    cache = CappedFileCache(str(tmpdir), max_bytes=25)
+
+    for key in ('a', 'b', 'c'):
+        cache.set(key, b'x' * 10)
+        path = tmpdir.join(cache.safe(key))
+        if path.check():
+            path.setmtime(ord(key))
+
+    assert cache.get('a') is None
+    assert cache.get('b') == b'x' * 10
+    assert cache.get('c') == b'x' * 10
+
+
+def test_open_package_streams_the_full_text_into_the_zip(app):
+    fulltext = io.BytesIO(b'%PDF-1.4' + b'x' * 100000)
+
+    with open_package(b'<TEI/>', fulltext) as package:
+        with ZipFile(package) as zf:
+            assert zf.read('meta.xml') == b'<TEI/>'
+            assert zf.read('doc.pdf') == fulltext.getvalue()
+            assert zf.getinfo('doc.pdf').compress_type == ZIP_STORED
+
+    assert package.closed
+
+
+def test_create_sends_the_package_from_its_start(app):
+    package = io.BytesIO(b'zip')
+    package.read()
+    with patch('inspire_hal.core.sword.get_pool') as get_pool:
+        connection = get_pool.return_value.connection.return_value.__enter__.return_value
+        create(b'<TEI/>', package)
+
+    assert connection.create.call_args[1]['payload'] is package
+    assert connection.create.call_args[1]['mimetype'] == 'application/zip'
+    assert package.tell() == 0
+
+
+def test_streaming_layer_sends_credentials_and_file_payloads():
+    layer = StreamingHttpLib2Layer()
+    layer.add_credentials('user', 'pass')
+    layer.h = Mock()
+    layer.h.request.return_value = (httplib2.Response({'status': '201'}), b'')
+    payload = Mock()
+
+    response, content = layer.request('https://hal/sword', 'POST', {'Packaging': 'AOfr'}, payload)
+
+    layer.h.request.assert_called_once_with(
+        'https://hal/sword', 'POST',
+        headers={'Packaging': 'AOfr', 'Authorization': 'Basic dXNlcjpwYXNz'},
+        body=payload,
+        connection_type=_REWINDING_CONNECTIONS['https'],
+    )
+    assert not payload.read.called
+    assert response.status == 201
+
+
+def test_rewinding_connection_sends_file_payloads_from_the_start():
+    connection = _REWINDING_CONNECTIONS['http']('hal')
+    payload = Mock()
+
+    with patch.object(httplib2.HTTPConnectionWithTimeout, 'request') as request:
+        # A stale connection makes httplib2 send the request again.
+        connection.request('POST', '/sword', payload, {})
+        connection.request('POST', '/sword', payload, {})
+
+    assert payload.seek.call_count == 2
+    assert request.call_count == 2
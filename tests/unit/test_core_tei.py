@@ -22,16 +22,26 @@
 
 from __future__ import absolute_import, division, print_function
 
+import io
+import pickle
+
+import pytest
+from jinja2 import Environment
+from jinja2.bccache import Bucket
+from mock import patch
+
 from inspire_schemas.api import load_schema, validate
-from inspire_hal.core.tei import _is_art, _is_comm
+from inspire_hal.core.renderer import AtomicBytecodeCache, render
+from inspire_hal.core.tei import TEIDocument, convert_to_tei, write_tei
 
 
-def test_is_art():
+def test_tei_document_kind_of_published_articles(app):
     schema = load_schema('hep')
     document_type_schema = schema['properties']['document_type']
     publication_info_schema = schema['properties']['publication_info']
 
     record = {
+        'control_number': 1,
         'document_type': [
             'article',
         ],
@@ -47,18 +57,113 @@ def test_is_art():
     assert validate(record['document_type'], document_type_schema) is None
     assert validate(record['publication_info'], publication_info_schema) is None
 
-    assert _is_art(record)
+    assert TEIDocument(record, hal_id_map={}, conference_records={}).kind == 'art'
 
 
-def test_is_comm():
+def test_tei_document_kind_of_conference_papers(app):
     schema = load_schema('hep')
     subschema = schema['properties']['document_type']
 
     record = {
+        'control_number': 1,
         'document_type': [
             'conference paper',
         ],
+        'publication_info': [
+            {'conference_record': {'$ref': 'http://localhost:5000/api/conferences/2'}},
+        ],
     }
+    conference = {'control_number': 2, 'titles': [{'title': 'A conference'}]}
     assert validate(record['document_type'], subschema) is None
 
-    assert _is_comm(record)
+    assert TEIDocument(record, hal_id_map={}, conference_records={2: conference}).kind == 'comm'
+
+
+PUBLISHED = {
+    'journal_title': 'Phys.Part.Nucl.Lett.',
+    'journal_volume': '14',
+    'page_start': '336',
+}
+
+
+@pytest.mark.parametrize('record,kind', [
+    ({'document_type': ['conference paper', 'article']}, 'comm'),
+    ({'document_type': ['article'], 'publication_info': [PUBLISHED]}, 'art'),
+    ({'document_type': ['article']}, 'preprint'),
+    ({'document_type': ['thesis']}, None),
+])
+def test_tei_document_kind(app, record, kind):
+    record['control_number'] = 1
+    conference = {'control_number': 2, 'titles': [{'title': 'A conference'}]}
+    if kind == 'comm':
+        record['publication_info'] = [{
+            'conference_record': {'$ref': 'http://localhost:5000/api/conferences/2'},
+        }]
+
+    assert TEIDocument(record, hal_id_map={}, conference_records={2: conference}).kind == kind
+
+
+def test_tei_document_only_reads_the_fields_of_its_kind(app):
+    record = {
+        'control_number': 1,
+        'document_type': ['article'],
+        'titles': [{'title': 'A preprint'}],
+    }
+
+    document = TEIDocument(record, hal_id_map={})
+
+    assert document.get_context()['title'] == 'A preprint'
+    assert 'doi' not in document.get_context()
+    unpickled = pickle.loads(pickle.dumps(document, protocol=0))
+    assert unpickled.title == document.title
+    assert list(unpickled.authors) == list(document.authors)
+
+
+def test_render_escapes_the_record():
+    record = {
+        'control_number': 1,
+        'document_type': ['article'],
+        'titles': [{'title': 'Limits on B -> K* & mu mu < 1'}],
+    }
+
+    tei = render('hal/preprint.xml', **TEIDocument(record, hal_id_map={}).get_context())
+
+    assert '<title>Limits on B -&gt; K* &amp; mu mu &lt; 1</title>' in tei
+
+
+def test_write_tei_streams_the_same_tei(app):
+    record = {
+        'authors': [{'full_name': u'Smith, J%s' % i} for i in range(2000)],
+        'control_number': 1,
+        'document_type': ['article'],
+        'titles': [{'title': u'Ünïcode'}],
+    }
+    fd = io.BytesIO()
+
+    write_tei(record, fd, hal_id_map={})
+
+    assert fd.getvalue() == convert_to_tei(record, hal_id_map={}).encode('utf8')
+
+
+def test_bytecode_cache_writes_templates_atomically(tmpdir):
+    cache = AtomicBytecodeCache(str(tmpdir))
+    bucket = Bucket(Environment(), 'key', 'checksum')
+    bucket.code = compile('x = 1', '<template>', 'exec')
+
+    cache.dump_bytecode(bucket)
+
+    loaded = Bucket(Environment(), 'key', 'checksum')
+    cache.load_bytecode(loaded)
+    assert loaded.code is not None
+    assert len(tmpdir.listdir()) == 1
+
+
+def test_bytecode_cache_leaves_no_partial_template(tmpdir):
+    cache = AtomicBytecodeCache(str(tmpdir))
+    bucket = Bucket(Environment(), 'key', 'checksum')
+    bucket.code = compile('x = 1', '<template>', 'exec')
+
+    with patch.object(Bucket, 'write_bytecode', side_effect=IOError), pytest.raises(IOError):
+        cache.dump_bytecode(bucket)
+
+    assert tmpdir.listdir() == []
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from mock import patch
+
+from inspire_hal.fulltext import get_fulltext_url, open_fulltext
+
+
+def test_get_fulltext_url_skips_hidden_and_non_pdf_documents():
+    record = {
+        'documents': [
+            {'fulltext': True, 'hidden': True, 'key': 'hidden.pdf', 'url': '/hidden.pdf'},
+            {'fulltext': True, 'key': 'fulltext.xml', 'url': '/fulltext.xml'},
+            {'key': 'arXiv.pdf', 'url': '/arXiv.pdf'},
+            {'fulltext': True, 'key': 'article.pdf', 'url': '/api/files/1/article.pdf'},
+        ],
+    }
+
+    expected = 'https://inspirehep.net/api/files/1/article.pdf'
+    result = get_fulltext_url(record, 'https://inspirehep.net')
+
+    assert expected == result
+
+
+def test_get_fulltext_url_without_fulltext():
+    assert get_fulltext_url({'documents': [{'key': 'arXiv.pdf', 'url': '/arXiv.pdf'}]}) is None
+
+
+@pytest.mark.parametrize('url', ['file:///etc/passwd', '/etc/passwd', 'ftp://example.org/a.pdf'])
+def test_get_fulltext_url_rejects_urls_that_are_not_http(url):
+    record = {'documents': [{'fulltext': True, 'key': 'article.pdf', 'url': url}]}
+
+    with pytest.raises(ValueError):
+        get_fulltext_url(record)
+
+
+def test_get_fulltext_url_rejects_local_files_whatever_the_base_url():
+    record = {'documents': [{'fulltext': True, 'key': 'article.pdf', 'url': 'file:///etc/passwd'}]}
+
+    with pytest.raises(ValueError):
+        get_fulltext_url(record, 'https://inspirehep.net')
+
+
+def test_open_fulltext_does_not_read_local_files(tmpdir):
+    doc_file = tmpdir.join('article.pdf')
+    doc_file.write_binary(b'%PDF-1.4')
+
+    with pytest.raises(ValueError):
+        with open_fulltext('file://' + str(doc_file)):
+            pass
+
+
+def test_open_fulltext_yields_the_download_without_reading_it():
+    with patch('inspire_hal.fulltext._get_http') as get_http:
+        response = get_http.return_value.request.return_value
+        response.status = 200
+
+        with open_fulltext('https://inspirehep.net/files/article.pdf') as fulltext:
+            assert fulltext is response
+            assert not response.read.called
+
+    assert response.release_conn.called
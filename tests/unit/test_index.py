@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+from flask import current_app
+from mock import patch
+
+from inspire_hal.index import InstitutionIndex, write_index
+from inspire_hal.utils import get_linked_records
+
+
+def test_index_finds_the_hal_id_of_institutions(tmpdir):
+    path = str(tmpdir.join('index.bin'))
+    count = write_index(path, [(902725, u'300037'), (1, None), (5, u'ökonomie'), (3, u'42')])
+
+    index = InstitutionIndex(path)
+
+    assert count == len(index) == 4
+    assert index.get(902725) == u'300037'
+    assert index.get(5) == u'ökonomie'
+    assert index.get(1, 'missing') is None
+    assert index.get(2, 'missing') == 'missing'
+    assert 3 in index
+    assert 902726 not in index
+    index.close()
+
+
+def test_empty_index(tmpdir):
+    path = str(tmpdir.join('index.bin'))
+    write_index(path, [])
+
+    assert InstitutionIndex(path).get(1) is None
+
+
+def test_index_rejects_other_files(tmpdir):
+    path = tmpdir.join('index.bin')
+    path.write('not an index')
+
+    with pytest.raises(ValueError):
+        InstitutionIndex(str(path))
+
+
+@pytest.mark.parametrize('size', [0, 4])
+def test_index_rejects_files_shorter_than_the_header(tmpdir, size):
+    path = str(tmpdir.join('index.bin'))
+    write_index(path, [(1, u'300')])
+    with open(path, 'r+b') as fd:
+        fd.truncate(size)
+
+    with pytest.raises(ValueError):
+        InstitutionIndex(path)
+
+
+@pytest.mark.parametrize('missing', [1, 8])
+def test_index_rejects_truncated_files(tmpdir, missing):
+    path = str(tmpdir.join('index.bin'))
+    write_index(path, [(1, u'300'), (2, u'301')])
+    with open(path, 'r+b') as fd:
+        fd.seek(-missing, 2)
+        fd.truncate()
+
+    with pytest.raises(ValueError):
+        InstitutionIndex(path)
+
+
+def test_get_linked_records_reads_institutions_from_the_index(app, tmpdir):
+    path = str(tmpdir.join('index.bin'))
+    write_index(path, [(1, u'300'), (2, None)])
+    records = [{
+        'authors': [
+            {'affiliations': [{'record': {'$ref': 'http://localhost:5000/api/institutions/%d' % recid}}]}
+            for recid in (1, 2, 3)
+        ],
+    }]
+
+    with patch.dict(current_app.config, {'HAL_INSTITUTION_INDEX_FILE': path}), \
+            patch('inspire_hal.utils.get_db_records', return_value=[]) as get_db_records:
+        result = get_linked_records(records)
+
+    assert get_db_records.call_args_list[0][0][0] == [('ins', 3)]
+    assert result == [({1: u'300'}, {})]
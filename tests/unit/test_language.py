@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from langdetect.language import Language
+from mock import patch
+
+from inspire_hal.core.language import detect_language
+
+ENGLISH = (
+    u'We study the production of top quarks in proton collisions at the LHC. '
+    u'The cross section of this process is measured with the data collected by '
+    u'the detector and it is compared to the predictions of the Standard Model.'
+)
+
+FRENCH = (
+    u'Nous étudions la production de quarks top dans les collisions de protons '
+    u'au LHC. La section efficace de ce processus est mesurée avec les données '
+    u'collectées par le détecteur et comparée aux prédictions du Modèle Standard.'
+)
+
+
+def test_detect_language_takes_english_looking_texts_as_english():
+    with patch('inspire_hal.core.language.detect_langs') as detect_langs:
+        assert detect_language(ENGLISH, ['fr']) == 'en'
+
+    assert not detect_langs.called
+
+
+def test_detect_language_ignores_symbols_in_english_texts():
+    text = ENGLISH + u' The data were collected at √s = 13 TeV by Müller et al., with μ > 1.'
+
+    assert detect_language(text, ['fr']) == 'en'
+
+
+def test_detect_language_does_not_trust_the_declared_language_blindly():
+    assert detect_language(FRENCH, ['en']) == 'fr'
+
+
+def test_detect_language_uses_the_declared_language_when_unsure():
+    with patch('inspire_hal.core.language.detect_langs') as detect_langs:
+        detect_langs.return_value = [Language('fr', 0.6), Language('it', 0.4)]
+        assert detect_language(FRENCH + u' (declared)', ['it']) == 'it'
+
+
+def test_detect_language_falls_back_to_langdetect():
+    assert detect_language(FRENCH) == 'fr'
+
+
+def test_detect_language_is_memoized():
+    text = FRENCH + u' (memoized)'
+    with patch('inspire_hal.core.language.detect_langs') as detect_langs:
+        detect_langs.return_value = [Language('fr', 0.99)]
+        assert detect_language(text) == 'fr'
+        assert detect_language(text) == 'fr'
+
+    assert detect_langs.call_count == 1
+
+
+def test_detect_language_of_nothing():
+    assert detect_language(None) == ''
+    assert detect_language(u'?!') == ''
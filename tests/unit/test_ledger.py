@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from inspire_hal.ledger import Ledger, get_fingerprint
+
+
+def test_get_fingerprint_is_the_same_for_text_and_utf8():
+    assert get_fingerprint(u'<title>Caf\xe9</title>') == get_fingerprint(b'<title>Caf\xc3\xa9</title>')
+
+
+def test_ledger_remembers_uploads_across_runs(tmpdir):
+    path = str(tmpdir.join('ledger.sqlite'))
+
+    with Ledger(path) as ledger:
+        assert ledger.get(1) is None
+        ledger.set(1, 'hal-01', 'abc')
+        ledger.set(1, 'hal-01', 'def')
+
+    with Ledger(path) as ledger:
+        assert ledger.get(1) == ('hal-01', 'def')
+
+
+def test_ledger_commits_created_records_at_once(tmpdir):
+    path = str(tmpdir.join('ledger.sqlite'))
+    ledger = Ledger(path)
+    other = Ledger(path)
+
+    ledger.set(1, 'hal-01', 'abc')
+    assert other.get(1) is None
+
+    ledger.set(2, 'hal-02', 'def', created=True)
+    assert other.get(2) == ('hal-02', 'def')
+
+    ledger.close()
+    other.close()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from sword2.exceptions import HTTPResponseError, ServerError
+
+from inspire_hal.limiter import AdaptiveLimiter, TokenBucket
+
+
+@patch('inspire_hal.limiter.time.sleep')
+@patch('inspire_hal.limiter.time.time', return_value=100.0)
+def test_token_bucket_waits_once_the_burst_is_spent(time_, sleep):
+    bucket = TokenBucket(rate=2, burst=2)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert [args[0][0] for args in sleep.call_args_list] == [0.5, 1.0]
+    assert bucket.waited == 1.5
+
+
+def test_limiter_grows_while_requests_succeed():
+    limiter = AdaptiveLimiter(minimum=1, maximum=4)
+
+    for _ in range(20):
+        limiter.call(lambda: None)
+
+    assert limiter.limit == 4
+    assert limiter.requests == 20
+
+
+def test_limiter_halves_on_overload():
+    limiter = AdaptiveLimiter(minimum=1, maximum=8)
+    limiter.limit = 8.0
+
+    with pytest.raises(ServerError):
+        limiter.call(_raise(ServerError({'status': 503})))
+
+    assert limiter.limit == 4
+    assert limiter.decreases == 1
+
+
+def test_limiter_ignores_rejected_records():
+    limiter = AdaptiveLimiter(minimum=1, maximum=8)
+    limiter.limit = 8.0
+
+    with pytest.raises(HTTPResponseError):
+        limiter.call(_raise(HTTPResponseError({'status': 400})))
+
+    assert limiter.decreases == 0
+
+
+def test_limiter_decreases_once_per_burst_of_failures():
+    limiter = AdaptiveLimiter(minimum=1, maximum=8)
+    limiter.limit = 8.0
+
+    starts = [limiter._acquire() for _ in range(4)]
+    for start in starts:
+        limiter._release(start, overloaded=True)
+
+    assert limiter.limit == 4
+    assert limiter.decreases == 1
+
+
+def test_limiter_caps_requests_in_flight():
+    limiter = AdaptiveLimiter(minimum=2, maximum=2)
+    threads = [
+        threading.Thread(target=limiter.call, args=(lambda: time.sleep(0.01),))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.peak == 2
+    assert limiter.requests == 8
+
+
+def _raise(exception):
+    def _func():
+        raise exception
+    return _func
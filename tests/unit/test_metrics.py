@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+
+from inspire_hal.metrics import Registry
+
+
+def test_histogram_counts_observations_in_cumulative_buckets():
+    histogram = Registry().histogram('upload_seconds', 'Uploads.', buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 3, 4]
+    assert histogram.count == 4
+    assert histogram.sum == 4.25
+    assert str(histogram) == '4 in 4.2s, 1.062s on average'
+
+
+def test_registry_returns_the_same_metric_by_name():
+    metrics = Registry()
+
+    assert metrics.counter('records_total', 'Records.') is metrics.counter('records_total', '')
+
+
+def test_format_follows_the_prometheus_text_format():
+    metrics = Registry('hal_push_')
+    metrics.counter('records_total', 'Records processed.').inc(2, outcome='ok')
+    metrics.histogram('upload_seconds', 'Uploads.', buckets=(1.0,)).observe(0.5)
+
+    expected = u'''# HELP hal_push_records_total Records processed.
+# TYPE hal_push_records_total counter
+hal_push_records_total{outcome="ok",shard="0/2"} 2
+# HELP hal_push_upload_seconds Uploads.
+# TYPE hal_push_upload_seconds histogram
+hal_push_upload_seconds_bucket{le="1.0",shard="0/2"} 1
+hal_push_upload_seconds_bucket{le="+Inf",shard="0/2"} 1
+hal_push_upload_seconds_sum{shard="0/2"} 0.5
+hal_push_upload_seconds_count{shard="0/2"} 1
+'''
+
+    assert metrics.format({'shard': '0/2'}) == expected
+
+
+def test_write_textfile_replaces_the_file(tmpdir):
+    path = str(tmpdir.join('hal_push.prom'))
+    metrics = Registry()
+    metrics.gauge('duration_seconds', 'Duration.').set(12.5)
+
+    metrics.write_textfile(path)
+
+    with io.open(path, encoding='utf8') as fd:
+        assert u'duration_seconds 12.5\n' in fd.read()
+    assert os.listdir(str(tmpdir)) == ['hal_push.prom']
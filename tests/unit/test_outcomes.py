@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from inspire_hal.outcomes import OutcomeLog, get_failed, read_outcomes
+
+
+def test_outcome_log_writes_one_json_object_per_record(tmpdir):
+    path = str(tmpdir.join('outcomes.jsonl'))
+
+    with OutcomeLog(path) as outcome_log:
+        outcome_log.write(1, 'create', 'hal-1', 1.23456)
+        outcome_log.write(2, 'update', 'hal-2', 0.5, 'server', u'500 Internal server error')
+
+    assert list(read_outcomes(path)) == [
+        {
+            'control_number': 1, 'action': 'create', 'hal_id': 'hal-1', 'seconds': 1.235,
+            'error': None, 'message': None,
+        },
+        {
+            'control_number': 2, 'action': 'update', 'hal_id': 'hal-2', 'seconds': 0.5,
+            'error': 'server', 'message': u'500 Internal server error',
+        },
+    ]
+
+
+def test_outcome_log_replaces_or_continues_the_log(tmpdir):
+    path = str(tmpdir.join('outcomes.jsonl'))
+    for control_number, append in [(1, False), (2, False), (3, True)]:
+        with OutcomeLog(path, append=append) as outcome_log:
+            outcome_log.write(control_number, 'skip')
+
+    assert [outcome['control_number'] for outcome in read_outcomes(path)] == [2, 3]
+
+
+def test_get_failed_leaves_out_records_that_succeeded_afterwards(tmpdir):
+    path = str(tmpdir.join('outcomes.jsonl'))
+    with OutcomeLog(path) as outcome_log:
+        outcome_log.write(3, 'create', error='timeout')
+        outcome_log.write(1, 'update', 'hal-1', error='conversion')
+        outcome_log.write(2, 'create', error='server')
+        outcome_log.write(2, 'create', 'hal-2', 3.0)
+
+    assert get_failed(path) == [1, 3]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+
+import pytest
+from flask import current_app
+
+from inspire_hal.pipeline import map_in_order, prefetch
+
+
+def test_prefetch_keeps_the_order(app):
+    result = list(prefetch(current_app._get_current_object(), lambda: iter(range(50)), size=3))
+
+    assert result == list(range(50))
+
+
+def test_prefetch_raises_errors_of_the_producer(app):
+    def _produce():
+        yield 1
+        raise RuntimeError('lost connection to the DB')
+
+    items = prefetch(current_app._get_current_object(), _produce, size=3)
+
+    assert next(items) == 1
+    with pytest.raises(RuntimeError):
+        next(items)
+
+
+def test_prefetch_does_not_read_ahead_more_than_its_size(app):
+    produced = []
+
+    def _produce():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = prefetch(current_app._get_current_object(), _produce, size=5)
+    next(items)
+    items.close()
+
+    assert len(produced) < 10
+
+
+def test_map_in_order_in_the_calling_thread():
+    result = list(map_in_order(abs, [-1, 2, -3]))
+
+    assert result == [(-1, 1), (2, 2), (-3, 3)]
+
+
+def test_map_in_order_in_a_pool():
+    pool = multiprocessing.Pool(2)
+    try:
+        result = list(map_in_order(abs, range(-20, 0), pool=pool, window=4, key=lambda item: item * 2))
+    finally:
+        pool.terminate()
+        pool.join()
+
+    assert result == [(i, abs(i * 2)) for i in range(-20, 0)]
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import socket
+
+import httplib2
+import pytest
+from mock import Mock, patch
+
+from sword2.exceptions import HTTPResponseError, NotAuthorised, RequestTimeOut, ServerError
+
+from inspire_hal.retry import RetryPolicy, classify, is_retryable
+
+
+@pytest.mark.parametrize('exception,kind', [
+    (HTTPResponseError({'status': 429}), 'throttled'),
+    (ServerError({'status': 503}), 'server'),
+    (RequestTimeOut({'status': 408}), 'timeout'),
+    (socket.timeout(), 'timeout'),
+    (httplib2.ServerNotFoundError(), 'connection'),
+    (HTTPResponseError({'status': 400}, b'<sword:error/>'), 'client'),
+    (NotAuthorised({'status': 401}), 'client'),
+    (Exception('No SWORD2-Edit-IRI was given'), 'other'),
+])
+def test_classify(exception, kind):
+    assert classify(exception) == kind
+
+
+def test_local_file_errors_are_not_retryable():
+    assert not is_retryable(IOError(2, 'No such file or directory'))
+
+
+@patch('inspire_hal.retry.time.sleep')
+def test_call_retries_transient_failures(sleep):
+    func = Mock(side_effect=[ServerError({'status': 502}), socket.timeout(), 'receipt'])
+    policy = RetryPolicy(attempts=3)
+
+    assert policy.call(func) == 'receipt'
+    assert sleep.call_count == 2
+    assert policy.retries == {'server': 1, 'timeout': 1}
+    assert str(policy) == 'retries: 2 (1 server, 1 timeout)'
+
+
+@patch('inspire_hal.retry.time.sleep')
+def test_call_raises_the_last_error(sleep):
+    error = ServerError({'status': 500})
+    func = Mock(side_effect=[ServerError({'status': 503}), error])
+
+    with pytest.raises(ServerError) as excinfo:
+        RetryPolicy(attempts=2).call(func)
+
+    assert excinfo.value is error
+
+
+@patch('inspire_hal.retry.time.sleep')
+def test_call_does_not_retry_beyond_the_budget(sleep):
+    policy = RetryPolicy(attempts=3, budget=1)
+    func = Mock(side_effect=ServerError({'status': 503}))
+
+    with pytest.raises(ServerError):
+        policy.call(func)
+
+    assert func.call_count == 2
+    assert policy.refused == 1
+
+
+def test_get_delay_is_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+
+    assert all(0 <= policy.get_delay(attempt) <= 5.0 for attempt in range(1, 20))
+
+
+def test_get_delay_obeys_retry_after():
+    policy = RetryPolicy(base_delay=0.1, max_delay=60.0)
+    error = HTTPResponseError(httplib2.Response({'status': 429, 'retry-after': '30'}))
+
+    assert policy.get_delay(1, error) == 30.0
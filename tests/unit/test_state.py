@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2019 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import datetime
+
+import pytest
+
+from inspire_hal.state import load_watermark, parse_datetime, save_watermark
+
+
+def test_parse_datetime():
+    assert parse_datetime('2019-03-01') == datetime.datetime(2019, 3, 1)
+    assert parse_datetime('2019-03-01T10:20:30') == datetime.datetime(2019, 3, 1, 10, 20, 30)
+    assert parse_datetime('2019-03-01T10:20:30.000001') == datetime.datetime(2019, 3, 1, 10, 20, 30, 1)
+
+
+def test_parse_datetime_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        parse_datetime('01/03/2019')
+
+
+def test_load_watermark_without_previous_push(tmpdir):
+    assert load_watermark(str(tmpdir.join('watermark.json'))) is None
+
+
+@pytest.mark.parametrize('watermark', [
+    datetime.datetime(2019, 3, 1, 10, 20, 30),
+    datetime.datetime(2019, 3, 1, 10, 20, 30, 123456),
+])
+def test_save_watermark_roundtrip(tmpdir, watermark):
+    path = str(tmpdir.join('state', 'watermark.json'))
+
+    save_watermark(path, watermark)
+
+    assert load_watermark(path) == watermark
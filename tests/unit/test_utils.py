@@ -22,11 +22,21 @@
 
 from __future__ import absolute_import, division, print_function
 
+import pytest
+from mock import patch
+
 from inspire_schemas.api import load_schema, validate
+from inspire_hal.cache import LRUCache
 from inspire_hal.utils import (
+    Affiliation,
+    Author,
+    get_authors,
+    get_conference_record,
     get_divulgation,
     get_domains,
-
+    get_linked_records,
+    get_name_cache,
+    parse_name,
 )
 
 
@@ -62,3 +72,114 @@ def test_get_domains(app):
     result = get_domains(record)
 
     assert expected == result
+
+
+def _ref(endpoint, recid):
+    return {'$ref': 'http://localhost:5000/api/%s/%d' % (endpoint, recid)}
+
+
+def test_get_linked_records_queries_once_per_kind():
+    records = [
+        {
+            'authors': [
+                {'affiliations': [{'record': _ref('institutions', 1)}]},
+                {'affiliations': [{'record': _ref('institutions', 2)}]},
+            ],
+            'publication_info': [{'conference_record': _ref('conferences', 10)}],
+        },
+        {
+            'authors': [{'affiliations': [{'record': _ref('institutions', 2)}]}],
+        },
+    ]
+    institutions = [
+        {'control_number': 1, 'external_system_identifiers': [{'schema': 'HAL', 'value': '300'}]},
+        {'control_number': 2},
+    ]
+    conferences = [{'control_number': 10}]
+
+    with patch('inspire_hal.utils.get_db_records', side_effect=[institutions, conferences]) as get_db_records:
+        result = get_linked_records(records)
+
+    assert get_db_records.call_count == 2
+    assert result == [
+        ({1: '300'}, {10: {'control_number': 10}}),
+        ({}, {}),
+    ]
+
+
+def test_get_linked_records_only_queries_uncached_records():
+    records = [{
+        'authors': [
+            {'affiliations': [{'record': _ref('institutions', 1)}]},
+            {'affiliations': [{'record': _ref('institutions', 2)}]},
+            {'affiliations': [{'record': _ref('institutions', 3)}]},
+        ],
+    }]
+    hal_ids = LRUCache('institutions', maxsize=10)
+    hal_ids.set(1, '300')
+    conferences = LRUCache('conferences', maxsize=10)
+    institutions = [{'control_number': 2, 'external_system_identifiers': [{'schema': 'HAL', 'value': '301'}]}]
+
+    with patch('inspire_hal.utils.get_db_records', return_value=institutions) as get_db_records:
+        result = get_linked_records(records, hal_ids, conferences)
+        assert sorted(get_db_records.call_args_list[0][0][0]) == [('ins', 2), ('ins', 3)]
+
+        get_db_records.reset_mock()
+        assert get_linked_records(records, hal_ids, conferences) == result
+        assert all(not args[0][0] for args in get_db_records.call_args_list)
+
+    assert result == [({1: '300', 2: '301'}, {})]
+    assert hal_ids.hits == 4
+    assert hal_ids.misses == 2
+
+
+def test_get_linked_records_remembers_missing_conferences():
+    records = [{'publication_info': [{'conference_record': _ref('conferences', 10)}]}]
+    hal_ids = LRUCache('institutions', maxsize=10)
+    conferences = LRUCache('conferences', maxsize=10)
+
+    with patch('inspire_hal.utils.get_db_records', return_value=[]) as get_db_records:
+        assert get_linked_records(records, hal_ids, conferences) == [({}, {})]
+        get_db_records.reset_mock()
+        assert get_linked_records(records, hal_ids, conferences) == [({}, {})]
+        assert all(not args[0][0] for args in get_db_records.call_args_list)
+
+    assert conferences.hits == 1
+
+
+def test_get_conference_record_reports_missing_conferences():
+    record = {'publication_info': [{'conference_record': _ref('conferences', 10)}]}
+
+    with pytest.raises(ValueError) as excinfo:
+        get_conference_record(record, conference_records={})
+
+    assert str(excinfo.value) == 'Conference record 10 not found'
+
+
+def test_get_authors_shares_names_and_affiliations():
+    record = {
+        'authors': [
+            {'full_name': 'Smith, John', 'affiliations': [{'record': _ref('institutions', 1)}]},
+            {'full_name': 'Smith, John', 'affiliations': [{'record': _ref('institutions', 1)}]},
+            {'full_name': 'Doe, Jane', 'affiliations': [{'record': _ref('institutions', 2)}]},
+        ],
+    }
+
+    authors = get_authors(record, hal_id_map={1: '300'})
+
+    assert authors == [
+        Author('John', 'Smith', (Affiliation('300'),)),
+        Author('John', 'Smith', (Affiliation('300'),)),
+        Author('Jane', 'Doe', ()),
+    ]
+    assert authors[0].first_name is authors[1].first_name
+    assert authors[0].affiliations[0] is authors[1].affiliations[0]
+
+
+def test_parse_name_is_memoized():
+    cache = get_name_cache()
+    hits = cache.hits
+
+    assert parse_name('Ellis, John Richard') == ('John Richard', 'Ellis')
+    assert parse_name('Ellis, John Richard') == ('John Richard', 'Ellis')
+    assert cache.hits == hits + 1